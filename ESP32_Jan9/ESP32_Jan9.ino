@@ -62,13 +62,104 @@ void displayBrailleChar(String signal) {
   }
 }
 
+// =======================================================
+// 差分更新 (conversion/braille_delta.py と同じ形式)
+// =======================================================
+// 1セル1文字('0' + 6bitマスク)の文字列を、'0'/'1' の文字列(6文字で1セル)に戻して signals に入れる
+// '0'〜'o' 以外の文字があれば false を返す(braille_delta.py の wire_to_cells() と同じ判定)
+bool decodeCells(const String& wire, String& signals) {
+  signals = "";
+  signals.reserve(wire.length() * PINS_PER_CHAR);
+  for (unsigned int i = 0; i < wire.length(); i++) {
+    int mask = wire.charAt(i) - '0';
+    if (mask < 0 || mask > 63) return false;
+    for (int p = 0; p < PINS_PER_CHAR; p++) {
+      signals += ((mask >> p) & 1) ? '1' : '0';
+    }
+  }
+  return true;
+}
+
+// 表示位置を NUM_CHARS の倍数にそろえて範囲内に収める
+int clampStartIndex(int index, int totalChars) {
+  if (index > totalChars - 1) index = totalChars - 1;
+  if (index < 0) index = 0;
+  return index - index % NUM_CHARS;
+}
+
+// 差分更新メッセージ(E<送信前のセル数>|<操作>|...)を適用する。適用できなければ false
+// 操作は位置の大きい順に並び、位置は送信前のセル列での番号なので、前から順に適用すればよい
+bool applyDeltaMessage(const String& msg) {
+  int sep = msg.indexOf('|');
+  int baseLen = msg.substring(1, sep < 0 ? msg.length() : sep).toInt();
+  int totalChars = receivedBrailleData.length() / PINS_PER_CHAR;
+  if (baseLen != totalChars) return false; // 前回のデータを受け取れていない
+
+  String data = receivedBrailleData;
+  int index = currentStartIndex;
+  while (sep >= 0) {
+    int next = msg.indexOf('|', sep + 1);
+    String op = msg.substring(sep + 1, next < 0 ? msg.length() : next);
+    sep = next;
+    char kind = op.charAt(0);
+    int cellCount = data.length() / PINS_PER_CHAR;
+
+    if (kind == 'D') { // 削除: D<位置>,<個数>
+      int comma = op.indexOf(',');
+      if (comma < 0) return false;
+      int pos = op.substring(1, comma).toInt();
+      int count = op.substring(comma + 1).toInt();
+      if (pos < 0 || count <= 0 || pos + count > cellCount) return false;
+      data.remove(pos * PINS_PER_CHAR, count * PINS_PER_CHAR);
+      if (pos + count <= index) index -= count;
+      else if (pos < index) index = pos;
+    } else if (kind == 'R' || kind == 'I') { // 置換: R<位置>:<セル> / 挿入: I<位置>:<セル>
+      int colon = op.indexOf(':');
+      if (colon < 0) return false;
+      int pos = op.substring(1, colon).toInt();
+      String cells;
+      if (!decodeCells(op.substring(colon + 1), cells)) return false;
+      int num = cells.length() / PINS_PER_CHAR;
+      int start = pos * PINS_PER_CHAR;
+      if (kind == 'R') {
+        if (pos < 0 || pos + num > cellCount) return false;
+        data = data.substring(0, start) + cells + data.substring(start + cells.length());
+      } else {
+        if (pos < 0 || pos > cellCount) return false;
+        data = data.substring(0, start) + cells + data.substring(start);
+        if (pos < index) index += num;
+      }
+    } else {
+      return false;
+    }
+  }
+  receivedBrailleData = data;
+  currentStartIndex = clampStartIndex(index, data.length() / PINS_PER_CHAR);
+  return true;
+}
+
 void loop() {
   // ---------- 1. シリアル受信処理 ----------
   if (Serial2.available() > 0) {
     lastRawData = Serial2.readStringUntil('\n');
     lastRawData.trim();
 
-    if (lastRawData.length() > 0 && lastRawData.length() % PINS_PER_CHAR == 0) {
+    if (lastRawData.startsWith("E")) { // 差分更新(読んでいる位置を保つ)
+      if (applyDeltaMessage(lastRawData)) {
+        Serial.println(">> Status: DELTA APPLIED");
+      } else {
+        Serial.println(">> Status: ERROR (Invalid Delta)");
+      }
+    } else if (lastRawData.startsWith("F")) { // 全体の置き換え(読んでいる位置はなるべく保つ)
+      String cells;
+      if (decodeCells(lastRawData.substring(1), cells)) {
+        receivedBrailleData = cells;
+        currentStartIndex = clampStartIndex(currentStartIndex, receivedBrailleData.length() / PINS_PER_CHAR);
+        Serial.println(">> Status: FULL UPDATE");
+      } else {
+        Serial.println(">> Status: ERROR (Invalid Cells)");
+      }
+    } else if (lastRawData.length() > 0 && lastRawData.length() % PINS_PER_CHAR == 0) {
       receivedBrailleData = lastRawData;
       currentStartIndex = 0;
       Serial.println(">> Status: NEW DATA STORED: " + receivedBrailleData);
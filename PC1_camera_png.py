@@ -1,64 +1,329 @@
 # PC1カメラ撮影用のPythonコード。Spaceキーで撮影し、PNG形式で指定したディレクトリに指定した名前で保存する。
+# --auto を付けると、書類が静止してピントが合った時点で自動的に撮影する。
+#
+# フレームの取得は別スレッド(FrameGrabber)で行い、直近のフレームをリングバッファに保持する。
+# 各フレームにはシャープさ(ラプラシアンの分散)と前フレームとの差(動き)を付けておき、
+# 撮影時はリングバッファの中で最もシャープなフレームを選ぶので、ぶれたフレームがOCRに渡らない。
+#
+# 使用法:
+#   python PC1_camera_png.py                           # Spaceキーで撮影(従来どおり)
+#   python PC1_camera_png.py --auto                    # 静止したら自動撮影
+#   python PC1_camera_png.py --auto --source video.mp4 --no-preview  # 動画ファイルで動作確認
+#   python PC1_camera_png.py --auto --source synthetic --no-preview  # 合成フレームで動作確認(カメラ不要)
 
 import cv2
 import os # ファイルパス操作用のモジュール(ファイルやディレクトリを移動したり、作成したりするために使う)
+import sys
+import time
+import argparse
+import threading # フレーム取得を別スレッドで行うためのモジュール
+from collections import deque # 直近のフレームを保持するリングバッファ
+import numpy as np
 
 # --- 設定 ---
 CAMERA_INDEX = 0      # 使用するカメラのデバイスID (通常0が内蔵カメラ)
 OUTPUT_FILENAME = "test1.png"
 OUTPUT_DIR = "imgs/captured_images" # 画像を保存するディレクトリ。data/
 
+RING_SIZE = 8             # リングバッファに保持するフレーム数
+ANALYSIS_WIDTH = 320      # シャープさ・動きの計算に使う縮小画像の幅[px](計算を軽くするため)
+STEADY_FRAMES = 5         # 何フレーム続けて静止していたら撮影するか
+MOTION_THRESHOLD = 2.0    # 前フレームとの平均差(0〜255)がこれ未満なら静止とみなす
+SHARPNESS_MIN = 50.0      # ラプラシアンの分散がこれ未満のフレームはぼやけているとみなす
+PNG_COMPRESSION = 1       # PNGの圧縮レベル(0〜9)。小さいほど保存が速い(OpenCVの既定は3)
+
+
 # ----------------------------------------------------
-# カメラ初期化
+# フレームの評価
 # ----------------------------------------------------
-cap = cv2.VideoCapture(CAMERA_INDEX)
+def analysis_gray(frame):
+    """
+    シャープさ・動きの計算用に、フレームを縮小したグレースケール画像に変換する。
+    """
+    h, w = frame.shape[:2]
+    if w > ANALYSIS_WIDTH:
+        frame = cv2.resize(frame, (ANALYSIS_WIDTH, int(h * ANALYSIS_WIDTH / w)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
 
-# カメラが開けたか確認
-if not cap.isOpened():
-    print("エラー: カメラが開けませんでした。デバイスIDを確認してください。")
-    exit()
 
-print("カメラ起動中... [Spaceキー]で撮影し保存、[Escキー]で終了します。")
+def sharpness(gray):
+    """
+    ラプラシアン(2次微分)の分散をシャープさとして返す。ピントが合って文字の輪郭がはっきりしているほど大きい。
+    """
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
 
 
-while True:
-    ret, frame = cap.read()  # 1フレーム分取得
-    if not ret:
-        print("エラー: フレーム取得失敗")
-        break
+def motion(gray, prev_gray):
+    """
+    前フレームとの画素値の平均差を返す。書類やカメラが動いているほど大きい。
+    """
+    if prev_gray is None or prev_gray.shape != gray.shape:
+        return float('inf')
+    return float(cv2.absdiff(gray, prev_gray).mean())
 
-    cv2.imshow("Camera Feed (Press SPACE to Capture)", frame)  # ウィンドウに表示
 
-    # キー入力を待機
-    key = cv2.waitKey(1) & 0xFF
+def pick_steady(entries, steady_frames=STEADY_FRAMES, motion_threshold=MOTION_THRESHOLD,
+                sharpness_min=SHARPNESS_MIN):
+    """
+    (フレーム, シャープさ, 動き, 時刻) のリスト(古い順)を受け取り、直近 steady_frames フレームが続けて
+    静止していて十分シャープなら、その中で最もシャープなフレームを返す。そうでなければ None。
+    """
+    recent = entries[-steady_frames:]
+    if len(recent) < steady_frames or any(m >= motion_threshold for _, _, m, _ in recent):
+        return None
+    best = max(recent, key=lambda e: e[1])
+    return best[0] if best[1] >= sharpness_min else None
 
-    # Spaceキーが押されたかチェック
-    if key == ord(' '):
-        # 画像の保存処理を実行
 
-        # ディレクトリが存在しなければ作成
-        if not os.path.exists(OUTPUT_DIR):
-            os.makedirs(OUTPUT_DIR)
+# ----------------------------------------------------
+# フレームの入力元
+# ----------------------------------------------------
+class SyntheticFrameSource:
+    """
+    カメラの代わりに使う合成フレームの入力元(cv2.VideoCaptureと同じ read() / isOpened() / release() を持つ)。
+    最初の moving_frames フレームは書類が動いてぼやけている状態を、その後は静止した状態を再現する。
+    """
+
+    def __init__(self, width=640, height=480, moving_frames=10, num_frames=60, fps=30.0):
+        self.width, self.height = width, height
+        self.moving_frames = moving_frames
+        self.num_frames = num_frames
+        self.interval = 1.0 / fps
+        self.index = 0
+        # 白地に黒い四角(文字の代わり)が行状に並んだ書類の画像
+        page = np.full((height, width, 3), 255, dtype=np.uint8)
+        for y in range(40, height - 40, 28):
+            for x in range(40, width - 40, 18):
+                cv2.rectangle(page, (x, y), (x + 12, y + 16), (0, 0, 0), 2)
+        self.page = page
 
-        output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILENAME)
+    def isOpened(self):
+        return True
 
-        # PNG形式で画像を保存 (OpenCVのデフォルトはPNG対応)
-        success = cv2.imwrite(output_path, frame)
+    def read(self):
+        if self.index >= self.num_frames:
+            return False, None
+        time.sleep(self.interval)
+        i = self.index
+        self.index += 1
+        if i < self.moving_frames:
+            # 動いている間は位置をずらし、ぼかしを入れる
+            shift = np.float32([[1, 0, (i * 7) % 40], [0, 1, (i * 3) % 20]])
+            frame = cv2.warpAffine(self.page, shift, (self.width, self.height), borderValue=(255, 255, 255))
+            return True, cv2.GaussianBlur(frame, (15, 15), 0)
+        return True, self.page.copy()
 
-        if success:
-            print(f" 画像を正常に保存しました: {output_path}")
-        else:
-            print(f" 画像の保存に失敗しました。")
+    def release(self):
+        pass
+
+
+def open_source(source):
+    """
+    入力元を開く。数字ならカメラのデバイスID、'synthetic' なら合成フレーム、それ以外は動画ファイルのパス。
+    """
+    if source == 'synthetic':
+        return SyntheticFrameSource()
+    if str(source).isdigit():
+        return cv2.VideoCapture(int(source))
+    return cv2.VideoCapture(source)
 
-        break
 
-    # Escキー (ASCII 27) で終了
-    elif key == 27:
-        print("ユーザー操作により終了します。")
-        break
+# ----------------------------------------------------
+# フレーム取得スレッド
+# ----------------------------------------------------
+class FrameGrabber(threading.Thread):
+    """
+    入力元から別スレッドでフレームを読み続け、直近のフレームを(フレーム, シャープさ, 動き, 時刻)の形で
+    リングバッファに保持する。表示やキー入力の待ち時間に関係なく、最新のフレームが手に入る。
+    """
+
+    def __init__(self, cap, ring_size=RING_SIZE):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.ring = deque(maxlen=ring_size)
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock) # 新しいフレームが入ったことを知らせる
+        self.stopped = threading.Event()
+        self.finished = False # 入力元の終わり(動画ファイルの最後)に達したか、読み込みに失敗した
+        self.frame_count = 0
+
+    def run(self):
+        prev_gray = None
+        while not self.stopped.is_set():
+            ret, frame = self.cap.read()  # 1フレーム分取得
+            if not ret:
+                break
+            gray = analysis_gray(frame)
+            entry = (frame, sharpness(gray), motion(gray, prev_gray), time.monotonic())
+            prev_gray = gray
+            with self.lock:
+                self.ring.append(entry)
+                self.frame_count += 1
+                self.new_frame.notify_all()
+        with self.lock:
+            self.finished = True
+            self.new_frame.notify_all()
+
+    def stop(self):
+        self.stopped.set()
+
+    def snapshot(self):
+        """
+        リングバッファの中身をリストで返す(古い順)。
+        """
+        with self.lock:
+            return list(self.ring)
+
+    def latest(self):
+        """
+        最新のフレームを返す。まだなければ None。
+        """
+        with self.lock:
+            return self.ring[-1][0] if self.ring else None
+
+    def best(self):
+        """
+        リングバッファの中で最もシャープなフレームを返す。まだなければ None。
+        """
+        entries = self.snapshot()
+        return max(entries, key=lambda e: e[1])[0] if entries else None
+
+    def wait_steady(self, timeout=None):
+        """
+        書類が静止して十分シャープになるまで待ち(pick_steady)、選ばれたフレームを返す。
+        タイムアウトまたは入力元の終わりに達したら None。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        seen = 0
+        with self.lock:
+            while True:
+                if self.frame_count != seen:
+                    seen = self.frame_count
+                    frame = pick_steady(list(self.ring))
+                    if frame is not None:
+                        return frame
+                if self.finished:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.new_frame.wait(remaining)
+
 
 # ----------------------------------------------------
-# 終了処理
+# 保存
 # ----------------------------------------------------
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+def save_frame(frame, output_dir=OUTPUT_DIR, filename=OUTPUT_FILENAME):
+    """
+    フレームを高速な圧縮設定でPNG形式で保存し、保存先のパスを返す。失敗した場合は None。
+    """
+    # ディレクトリが存在しなければ作成
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    output_path = os.path.join(output_dir, filename)
+
+    # PNG形式で画像を保存 (圧縮レベルを下げて保存時間を短くする)
+    success = cv2.imwrite(output_path, frame, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+    return output_path if success else None
+
+
+def capture_auto(cap, timeout=None):
+    """
+    表示なしで自動撮影を行い、選ばれたフレームを返す。静止しないまま終わった場合は None。
+    """
+    grabber = FrameGrabber(cap)
+    grabber.start()
+    try:
+        return grabber.wait_steady(timeout=timeout)
+    finally:
+        grabber.stop()
+        grabber.join()
+
+
+def run_preview(cap, auto):
+    """
+    カメラ映像を表示しながら撮影する。Spaceキー(または --auto で静止を検出した時点)で、
+    リングバッファ内の最もシャープなフレームを返す。Escキーで終了した場合は None。
+    """
+    grabber = FrameGrabber(cap)
+    grabber.start()
+    try:
+        while not grabber.finished:
+            entries = grabber.snapshot()
+            if entries:
+                cv2.imshow("Camera Feed (Press SPACE to Capture)", entries[-1][0])  # ウィンドウに表示
+
+            if auto:
+                frame = pick_steady(entries)
+                if frame is not None:
+                    return frame
+
+            # キー入力を待機(フレームの取得は別スレッドなので、ここで待っても取りこぼさない)
+            key = cv2.waitKey(15) & 0xFF
+
+            # Spaceキーが押されたかチェック
+            if key == ord(' '):
+                return grabber.best()
+
+            # Escキー (ASCII 27) で終了
+            elif key == 27:
+                print("ユーザー操作により終了します。")
+                return None
+        print("エラー: フレーム取得失敗")
+        return None
+    finally:
+        grabber.stop()
+        grabber.join()
+        cv2.destroyAllWindows()
+
+
+# ----------------------------------------------------
+# メイン実行ブロック
+# ----------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="書類を撮影してPNG形式で保存する")
+    parser.add_argument('--source', default=str(CAMERA_INDEX),
+                        help="カメラのデバイスID、動画ファイルのパス、または synthetic(合成フレーム)")
+    parser.add_argument('--auto', action='store_true', help="書類が静止してピントが合ったら自動で撮影する")
+    parser.add_argument('--no-preview', action='store_true', help="映像を表示しない(--autoと併用)")
+    parser.add_argument('--timeout', type=float, default=None, help="--auto --no-preview で待つ最大時間[秒]")
+    args = parser.parse_args()
+
+    # ----------------------------------------------------
+    # カメラ初期化
+    # ----------------------------------------------------
+    cap = open_source(args.source)
+
+    # カメラが開けたか確認
+    if not cap.isOpened():
+        print("エラー: カメラが開けませんでした。デバイスIDを確認してください。")
+        sys.exit(1)
+
+    if args.no_preview:
+        if not args.auto:
+            print("エラー: --no-preview は --auto と一緒に指定してください。")
+            sys.exit(1)
+        print("自動撮影中... 書類が静止するのを待っています。")
+        frame = capture_auto(cap, args.timeout)
+        if frame is None:
+            print("静止したフレームが得られなかったため終了します。")
+    else:
+        if args.auto:
+            print("カメラ起動中... 書類が静止すると自動で撮影します。[Spaceキー]で手動撮影、[Escキー]で終了します。")
+        else:
+            print("カメラ起動中... [Spaceキー]で撮影し保存、[Escキー]で終了します。")
+        frame = run_preview(cap, args.auto)
+
+    if frame is not None:
+        # 画像の保存処理を実行
+        output_path = save_frame(frame)
+        if output_path:
+            print(f" 画像を正常に保存しました: {output_path}")
+        else:
+            print(f" 画像の保存に失敗しました。")
+
+    # ----------------------------------------------------
+    # 終了処理
+    # ----------------------------------------------------
+    cap.release()
@@ -0,0 +1,295 @@
+# PC1から送信された画像データをPC2が受信するためのPythonサーバー(PC2_processing_Server.pde と同じ通信手順)。
+# PC1_Img_Client.pde はそのまま使える。
+#
+# 通信手順(PC2_processing_Server.pde と同じ):
+#   1. サーバー → クライアント: 1バイト(0)   撮影画像の送信指示
+#   2. クライアント → サーバー: 8バイト      画像の高さ・幅(それぞれint型4バイト, リトルエンディアン)
+#   3. サーバー → クライアント: 1バイト(1)   高さと幅の受信完了
+#   4. クライアント → サーバー: 高さ×幅×3バイト  画像データ(RGB)
+#   5. サーバー → クライアント: 1バイト(2)   画像データの受信完了
+# 追加の形式として、高さに -1 を入れた場合は「幅」の欄を圧縮画像(PNG/JPEG)のバイト数とみなし、
+# 4. で圧縮画像のバイト列を受け取る(通信量を減らしたいPythonクライアント向け)。
+#
+# Processing版との違い:
+#   * 受信データは画像サイズ分だけ確保した配列(NumPy)に直接書き込み、1画素ずつのコピーは行わない。
+#   * 複数のクライアントを同時に扱える(クライアントごとに受信状態を持つ)。
+#   * 受信画像を上書きせず、received_imgs/ に一意な名前で保存する(または次の処理に直接渡す)。
+#   * Processing版のマウスクリックの代わりに、Enterキーで接続中のすべてのクライアントに送信を指示する。
+#
+# PC1_Img_Client.pde は画像データの受信完了(2)を受け取ると受信バッファを空にするため、
+# 受信完了と次の送信指示(0)を続けて送ると、送信指示も一緒に捨てられて双方が待ち続けてしまう。
+# そこで次の送信指示は、受信完了を送ってから REQUEST_DELAY 秒おいて送る。
+#
+# 使用法:
+#   python PC2_img_server.py [--port 5554] [--continuous] [--latest test1.png]
+
+import os
+import sys
+import time
+import struct
+import asyncio
+import argparse
+import itertools
+import threading
+import numpy as np
+import cv2
+
+# --- 設定 ---
+DEFAULT_PORT = 5554 # PC2_processing_Server.pde と同じポート番号
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PC2_processing_Server", "received_imgs")
+MAX_PIXELS = 8192 * 8192 # これより大きい画像サイズが送られてきたら不正なデータとして切断する
+MAX_COMPRESSED_BYTES = 256 * 1024 * 1024
+PNG_COMPRESSION = 1 # 保存時のPNG圧縮レベル(小さいほど速い)
+REQUEST_DELAY = 0.5 # 画像データの受信完了を送ってから、次の送信指示を送るまでの待ち時間[秒]
+
+MSG_REQUEST = b'\x00'       # 撮影画像の送信指示
+MSG_HEADER_DONE = b'\x01'   # 高さと幅の受信完了
+MSG_IMAGE_DONE = b'\x02'    # 画像データの受信完了
+COMPRESSED_MARKER = -1      # 高さの欄にこの値が入っていたら圧縮画像
+HEADER = struct.Struct('<ii') # 高さ・幅(int型4バイト×2, リトルエンディアン)
+
+STATE_HEADER = 0      # 状態0: 画像の高さと幅の受信
+STATE_RAW = 1         # 状態1: 画像データ(RGB)の受信
+STATE_COMPRESSED = 2  # 状態1の圧縮画像版
+
+
+class ImageReceiverProtocol(asyncio.BufferedProtocol):
+    """
+    1つのクライアントとの通信を担当する。asyncioのBufferedProtocolを使い、
+    受信データをあらかじめ確保したバッファ(画像データなら画像の配列そのもの)に直接書き込ませる。
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.client_id = None
+        self.state = STATE_HEADER
+        self.header = bytearray(HEADER.size)
+        self.buffer = memoryview(self.header) # 次に受信データを書き込む先
+        self.received = 0
+        self.image = None
+        self.request_pending = False # 送信指示を送った(または送る予定の)まま、高さと幅をまだ受信していない
+        self.ready_at = 0.0          # この時刻(イベントループの時刻)以降なら送信指示を送ってよい
+
+    # --- 接続・切断 ---
+    def connection_made(self, transport):
+        self.transport = transport
+        self.client_id = self.server.register(self)
+        print(f"クライアント({transport.get_extra_info('peername')})と接続", file=sys.stderr)
+        self.request_image() # Processing版ではマウスクリックで送っていた送信指示
+
+    def connection_lost(self, exc):
+        self.server.unregister(self)
+        print(f"クライアント{self.client_id}: 切断", file=sys.stderr)
+
+    def request_image(self):
+        """
+        クライアントに撮影画像の送信を指示する(受信待ちの状態で、まだ指示していないときだけ)。
+        直前に受信完了を送ったばかりなら、クライアントが受信待ちに戻るまで待ってから送る。
+        """
+        if self.state != STATE_HEADER or self.request_pending:
+            return
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.request_pending = True # 指示が重なると、クライアントは2つ目を高さと幅の受信完了(1)と取り違える
+        loop = asyncio.get_running_loop()
+        delay = self.ready_at - loop.time()
+        if delay > 0:
+            loop.call_later(delay, self._send_request)
+        else:
+            self._send_request()
+
+    def _send_request(self):
+        if self.state == STATE_HEADER and not self.transport.is_closing():
+            self.transport.write(MSG_REQUEST)
+
+    # --- 受信 ---
+    def get_buffer(self, sizehint):
+        # まだ埋まっていない部分をそのまま渡すので、受信データはコピーされずにバッファへ入る
+        return self.buffer[self.received:]
+
+    def buffer_updated(self, nbytes):
+        self.received += nbytes
+        if self.received < len(self.buffer):
+            return # まだ足りない
+
+        if self.state == STATE_HEADER:
+            self.request_pending = False
+            height, width = HEADER.unpack(self.header)
+            if height == COMPRESSED_MARKER:
+                if not 0 < width <= MAX_COMPRESSED_BYTES:
+                    return self._abort(f"不正な圧縮画像サイズ: {width}")
+                self.state = STATE_COMPRESSED
+                self._expect(bytearray(width))
+            else:
+                if height <= 0 or width <= 0 or height * width > MAX_PIXELS:
+                    return self._abort(f"不正な画像サイズ: 高さ={height}, 幅={width}")
+                self.state = STATE_RAW
+                self.image = np.empty((height, width, 3), dtype=np.uint8) # 受信データをそのまま入れる配列
+                self._expect(memoryview(self.image).cast('B'))
+            self.transport.write(MSG_HEADER_DONE) # 高さと幅の受信完了をクライアントに通知
+            return
+
+        if self.state == STATE_RAW:
+            image, self.image = self.image, None
+        else:
+            data = np.frombuffer(self.buffer, dtype=np.uint8)
+            image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            if image is None:
+                return self._abort("圧縮画像を復元できませんでした。")
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) # 生データの場合と同じRGB順にそろえる
+        self.state = STATE_HEADER
+        self._expect(memoryview(self.header))
+        self.transport.write(MSG_IMAGE_DONE) # 画像データの受信完了をクライアントに通知
+        self.ready_at = asyncio.get_running_loop().time() + REQUEST_DELAY
+        self.server.frame_received(self, image)
+
+    def _expect(self, buffer):
+        """
+        次に受信するデータの書き込み先を設定する。
+        """
+        self.buffer = memoryview(buffer)
+        self.received = 0
+
+    def _abort(self, message):
+        print(f"クライアント{self.client_id}: {message} → 切断します", file=sys.stderr)
+        self.transport.close()
+
+
+class ImageServer:
+    """
+    複数のクライアントから画像を受信するサーバー。受信した画像(RGB, shape=(高さ, 幅, 3))は on_frame に渡す。
+    on_frame を省略した場合は received_imgs/ に一意な名前のPNGとして保存する。
+    """
+
+    def __init__(self, on_frame=None, output_dir=OUTPUT_DIR, latest_name=None, continuous=False):
+        self.on_frame = on_frame or self.save_frame
+        self.output_dir = output_dir
+        self.latest_name = latest_name # 指定した場合は、従来どおりこの名前でも上書き保存する
+        self.continuous = continuous   # 受信が終わるたびに次の画像を要求するか
+        self.clients = {}
+        self._ids = itertools.count(1)
+        self._frame_ids = itertools.count(1)
+        self.server = None
+
+    def register(self, protocol):
+        client_id = next(self._ids)
+        self.clients[client_id] = protocol
+        return client_id
+
+    def unregister(self, protocol):
+        self.clients.pop(protocol.client_id, None)
+
+    def frame_received(self, protocol, image):
+        """
+        1枚受信し終えたときに呼ばれる。保存などの重い処理はスレッドで行い、他のクライアントの受信を止めない。
+        """
+        frame_id = next(self._frame_ids)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self.on_frame, image, protocol.client_id, frame_id)
+        future.add_done_callback(self._report_error)
+        if self.continuous:
+            protocol.request_image() # クライアントが受信待ちに戻るまで REQUEST_DELAY 秒おいて送られる
+
+    @staticmethod
+    def _report_error(future):
+        if future.exception() is not None:
+            print(f"受信画像の処理中にエラーが発生しました: {future.exception()}", file=sys.stderr)
+
+    def save_frame(self, image, client_id, frame_id):
+        """
+        受信画像をPNGで保存する(既定の on_frame)。保存したパスを返す。
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"frame_{time.strftime('%Y%m%d_%H%M%S')}_c{client_id}_{frame_id:05d}.png"
+        path = os.path.join(self.output_dir, name)
+        bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR) # OpenCVはBGR順で保存する
+        params = [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+        cv2.imwrite(path, bgr, params)
+        if self.latest_name:
+            cv2.imwrite(os.path.join(self.output_dir, self.latest_name), bgr, params)
+        print(f"受信完了: {name} (高さ={image.shape[0]}, 幅={image.shape[1]})", file=sys.stderr)
+        return path
+
+    async def start(self, host='0.0.0.0', port=DEFAULT_PORT):
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: ImageReceiverProtocol(self), host, port)
+        return self.server
+
+    def request_all(self):
+        """
+        接続中のすべてのクライアントに撮影画像の送信を指示する。
+        """
+        for protocol in list(self.clients.values()):
+            protocol.request_image()
+        print(f"撮影画像の送信を指示: {len(self.clients)}台", file=sys.stderr)
+
+
+def request_on_enter(server, loop):
+    """
+    標準入力で1行(Enterキー)を受け取るたびに、接続中のすべてのクライアントに撮影画像の送信を指示する
+    (Processing版のマウスクリックの代わり)。loop は server が動いているイベントループ。
+    """
+    def read_lines():
+        for _ in sys.stdin:
+            loop.call_soon_threadsafe(server.request_all)
+
+    threading.Thread(target=read_lines, name="request-on-enter", daemon=True).start()
+
+
+# ----------------------------------------------------
+# 動作確認用クライアント(PC1_Img_Client.pde と同じ手順で送信する)
+# ----------------------------------------------------
+async def send_image(image, host='127.0.0.1', port=DEFAULT_PORT, compressed=False):
+    """
+    RGB画像(shape=(高さ, 幅, 3))をサーバーへ1枚送信する。compressed=True ならPNGに圧縮して送る。
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await reader.readexactly(1) # 送信指示(0)を待つ
+        if compressed:
+            ok, buf = cv2.imencode('.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+            payload = buf.tobytes()
+            writer.write(HEADER.pack(COMPRESSED_MARKER, len(payload)))
+        else:
+            payload = np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+            writer.write(HEADER.pack(image.shape[0], image.shape[1]))
+        await writer.drain()
+        if await reader.readexactly(1) != MSG_HEADER_DONE:
+            raise ConnectionError("高さと幅の受信完了の通知がありません。")
+        writer.write(payload)
+        await writer.drain()
+        if await reader.readexactly(1) != MSG_IMAGE_DONE:
+            raise ConnectionError("画像データの受信完了の通知がありません。")
+        return len(payload)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+# ----------------------------------------------------
+# メイン実行ブロック
+# ----------------------------------------------------
+async def main(args):
+    server = ImageServer(output_dir=args.output_dir, latest_name=args.latest, continuous=args.continuous)
+    await server.start(args.host, args.port)
+    request_on_enter(server, asyncio.get_running_loop())
+    print(f"サーバ： {args.host}:{args.port} で待機中 (保存先: {args.output_dir})", file=sys.stderr)
+    print("Enterキーで、接続中のクライアントに撮影画像の送信を指示します。", file=sys.stderr)
+    await asyncio.Event().wait() # Ctrl+Cで終了するまで待ち続ける
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="PC1からの画像を受信するサーバー")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help="受信画像の保存先")
+    parser.add_argument('--latest', default=None,
+                        help="一意な名前に加えて、この名前(例: test1.png)でも上書き保存する")
+    parser.add_argument('--continuous', action='store_true',
+                        help="1枚受信するたびに、次の画像の送信を指示する")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
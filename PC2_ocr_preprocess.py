@@ -0,0 +1,280 @@
+# 受信画像をOCR(yomitoku)に渡す前に小さくする前処理。
+# これまではPC1から受信した画像(received_imgs/test1.png)をそのままyomitokuに渡していたため、
+# 文字が画像の一部にしか写っていなくても、カメラの解像度が上がるほどOCRに時間がかかっていた。
+#
+# 処理の流れ(受信した画像の配列のまま、NumPy/OpenCVでまとめて処理する):
+#   1. グレースケール化(3チャンネル → 1チャンネル)
+#   2. 文字の検出: 縮小した画像を適応的二値化し、連結成分のうち文字らしい大きさのものを文字とする
+#      (画像の端に接する成分 = 机や紙の縁 と、大きすぎる成分は除く)
+#   3. 傾きの推定: 文字の画素の座標を少しずつ回転させ、行ごとの画素数の偏りが最も大きくなる角度を探す
+#   4. 切り出しと傾き補正: 文字のある範囲だけを、傾きを戻しながら1回の warpAffine で切り出す
+#   5. 縮小: 文字の高さ(連結成分の高さの75パーセンタイル)が target_text_height になるよう縮小する(拡大はしない)
+#   6. (任意)大津の二値化
+#
+# 使用法:
+#   python PC2_ocr_preprocess.py PC2_processing_Server/received_imgs/test1.png -o ocr_input.png
+#   python PC2_ocr_preprocess.py --benchmark                      # test1.png とそれをもとに作った撮影画像で測定
+#   python PC2_ocr_preprocess.py --benchmark img1.png img2.png --binarize
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+
+# --- 設定 ---
+SAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "PC2_processing_Server", "received_imgs", "test1.png")
+TARGET_TEXT_HEIGHT = 32   # OCRに渡す画像での文字の高さ[画素]の目安
+ANALYSIS_MAX_SIDE = 1200  # 文字の検出・傾きの推定に使う縮小画像の長辺[画素]
+ADAPTIVE_BLOCK = 31       # 適応的二値化で明るさの基準をとる範囲[画素](縮小画像上)
+ADAPTIVE_C = 15           # 周囲の平均よりこれだけ暗い画素を文字とする
+MIN_COMPONENTS = 10       # 文字らしい連結成分がこれより少なければ、文字が写っていないとみなす
+MAX_COMPONENT_RATIO = 0.1 # 画像の高さ・幅に対してこれより大きい連結成分は文字ではない(図や影)
+MAX_SKEW = 15.0           # 推定する傾きの範囲[度]
+SKEW_STEP = 0.1           # 傾きの推定の細かさ[度]
+MAX_SKEW_POINTS = 50000   # 傾きの推定に使う画素の最大数(多い場合は間引く)
+TEXT_HEIGHT_PERCENTILE = 75 # 文字の高さとする連結成分の高さの分位(漢字・かなは部首や濁点で分かれるため中央値より上をとる)
+MARGIN = 1.5              # 切り出す範囲に足す余白(文字の高さの倍数)
+PNG_COMPRESSION = 1       # 保存時のPNG圧縮レベル(PC2_img_server.py と同じ)
+
+
+# ----------------------------------------------------
+# 各段階
+# ----------------------------------------------------
+def to_gray(image):
+    """
+    RGB画像(shape=(高さ, 幅, 3))をグレースケールにする。すでに1チャンネルならそのまま返す。
+    """
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def detect_text(gray):
+    """
+    文字を検出し、(文字の画素のx座標, y座標, 文字の高さ) を元の画像の座標・画素数で返す。
+    文字が見つからない場合は None を返す。
+    """
+    height, width = gray.shape
+    scale = min(1.0, ANALYSIS_MAX_SIDE / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    mask = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,
+                                 ADAPTIVE_BLOCK, ADAPTIVE_C)
+
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    x, y = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+    w, h = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    sh, sw = mask.shape
+    keep = ((h >= 2) & (stats[:, cv2.CC_STAT_AREA] >= 4)
+            & (h <= sh * MAX_COMPONENT_RATIO) & (w <= sw * MAX_COMPONENT_RATIO)
+            & (x > 0) & (y > 0) & (x + w < sw) & (y + h < sh)) # 画像の端に接する成分(机・紙の縁)は除く
+    keep[0] = False # ラベル0は背景
+    if np.count_nonzero(keep) < MIN_COMPONENTS:
+        return None
+
+    ys, xs = np.nonzero(keep[labels]) # 文字とみなした成分の画素の座標
+    if len(xs) > MAX_SKEW_POINTS:
+        step = len(xs) // MAX_SKEW_POINTS + 1
+        xs, ys = xs[::step], ys[::step]
+    text_height = float(np.percentile(h[keep], TEXT_HEIGHT_PERCENTILE)) / scale
+    return xs / scale, ys / scale, text_height
+
+
+def estimate_skew(xs, ys, text_height):
+    """
+    文字の画素の座標から傾き[度]を推定する。座標を各角度で回転させ、行(文字の高さの1/4ごと)ごとの
+    画素数の二乗和が最も大きくなる角度を選ぶ(行がそろうほど、画素が少数の行に集中する)。
+    全角度をまとめて計算するため、1度ごとに探したあと SKEW_STEP ごとに絞り込む。
+    """
+    bin_size = max(text_height / 4, 1.0)
+
+    def best_angle(angles):
+        rad = np.deg2rad(angles)[:, None]
+        rows = np.floor((ys[None, :] * np.cos(rad) - xs[None, :] * np.sin(rad)) / bin_size).astype(np.int64)
+        rows -= rows.min(axis=1, keepdims=True)
+        num_bins = int(rows.max()) + 1
+        counts = np.bincount((rows + np.arange(len(angles))[:, None] * num_bins).ravel(),
+                             minlength=len(angles) * num_bins).reshape(len(angles), num_bins)
+        score = (counts.astype(np.float64) ** 2).sum(axis=1)
+        return float(angles[np.argmax(score)])
+
+    coarse = best_angle(np.arange(-MAX_SKEW, MAX_SKEW + 0.5, 1.0))
+    return best_angle(np.arange(coarse - 1.0, coarse + 1.0 + SKEW_STEP / 2, SKEW_STEP))
+
+
+def crop_and_deskew(gray, xs, ys, angle, margin):
+    """
+    文字のある範囲(余白 margin 画素を含む)を、傾き angle[度]を戻しながら切り出す。
+    回転した画像全体は作らず、切り出す範囲だけを1回の warpAffine で計算する。
+    """
+    height, width = gray.shape
+    center = (width / 2, height / 2)
+    matrix = cv2.getRotationMatrix2D(center, angle, 1.0) # 座標を -angle 度回す(傾きが0になる)
+    rx = matrix[0, 0] * xs + matrix[0, 1] * ys + matrix[0, 2]
+    ry = matrix[1, 0] * xs + matrix[1, 1] * ys + matrix[1, 2]
+    x0, y0 = int(np.floor(rx.min() - margin)), int(np.floor(ry.min() - margin))
+    x1, y1 = int(np.ceil(rx.max() + margin)) + 1, int(np.ceil(ry.max() + margin)) + 1
+    if abs(angle) < SKEW_STEP / 2:
+        # 傾きがなければ配列の切り出しだけで済む
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+        return gray[y0:y1, x0:x1].copy()
+    matrix[:, 2] -= (x0, y0) # 切り出す範囲の左上が(0, 0)になるようにずらす
+    return cv2.warpAffine(gray, matrix, (x1 - x0, y1 - y0), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def binarize(gray):
+    """
+    大津の方法で白黒の2値にする。
+    """
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def preprocess_frame(image, target_text_height=TARGET_TEXT_HEIGHT, binarize_output=False, deskew=True):
+    """
+    受信画像(RGB または グレースケール)をOCR用に小さくし、(処理後の画像, 処理の情報) を返す。
+    文字が見つからない場合は、グレースケールにしただけの画像を返す。
+    """
+    info = {'input_shape': image.shape, 'input_bytes': image.nbytes,
+            'angle': 0.0, 'text_height': None, 'scale': 1.0}
+    gray = to_gray(image)
+    detected = detect_text(gray)
+    if detected is None:
+        out = gray
+    else:
+        xs, ys, text_height = detected
+        angle = estimate_skew(xs, ys, text_height) if deskew else 0.0
+        out = crop_and_deskew(gray, xs, ys, angle, margin=MARGIN * text_height)
+        scale = min(1.0, target_text_height / text_height)
+        if scale < 1.0:
+            out = cv2.resize(out, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        info.update(angle=angle, text_height=round(text_height, 1), scale=round(scale, 3))
+    if binarize_output:
+        out = binarize(out)
+    info.update(output_shape=out.shape, output_bytes=out.nbytes)
+    return out, info
+
+
+class OCRPreprocessor:
+    """
+    PC2_pipeline.py の前処理の段で使う。画像の読み込み・前処理・保存をまとめたもの。
+    """
+
+    def __init__(self, target_text_height=TARGET_TEXT_HEIGHT, binarize_output=False, deskew=True):
+        self.target_text_height = target_text_height
+        self.binarize_output = binarize_output
+        self.deskew = deskew
+
+    def __call__(self, image):
+        return preprocess_frame(image, self.target_text_height, self.binarize_output, self.deskew)
+
+    @staticmethod
+    def load(path):
+        """
+        画像ファイルをRGBの配列として読み込む(PC2_img_server.py から渡される配列と同じ形)。
+        """
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise OSError(f"画像を読み込めません: {path}")
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    @staticmethod
+    def save(path, image):
+        if not cv2.imwrite(path, image, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]):
+            raise OSError(f"画像を保存できませんでした: {path}")
+
+    @staticmethod
+    def describe(info):
+        return format_info(info)
+
+
+def format_info(info):
+    """
+    処理の情報を1行の文字列にする。
+    """
+    h, w = info['input_shape'][:2]
+    oh, ow = info['output_shape'][:2]
+    return (f"{w}x{h} ({info['input_bytes'] / 1024:.0f}KB) → {ow}x{oh} ({info['output_bytes'] / 1024:.0f}KB), "
+            f"傾き {info['angle']:+.1f}度, 文字の高さ {info['text_height']}画素, 縮小率 {info['scale']}")
+
+
+# ----------------------------------------------------
+# ベンチマーク
+# ----------------------------------------------------
+def synthetic_frame(image, angle=4.0, zoom=3.0, frame_size=(4000, 3000), seed=0):
+    """
+    スキャン画像から、カメラで撮影したような画像(拡大・傾き・机の背景・ノイズ)を作る。
+    """
+    rng = np.random.default_rng(seed)
+    page = cv2.resize(image, None, fx=zoom, fy=zoom, interpolation=cv2.INTER_CUBIC)
+    fw, fh = frame_size
+    frame = np.empty((fh, fw, 3), dtype=np.uint8)
+    frame[:] = (96, 84, 72) # 机の色
+    ph, pw = page.shape[:2]
+    matrix = cv2.getRotationMatrix2D((pw / 2, ph / 2), angle, 1.0)
+    matrix[:, 2] += ((fw - pw) / 2, (fh - ph) / 2) # 画像の中央に置く
+    cv2.warpAffine(page, matrix, (fw, fh), dst=frame, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_TRANSPARENT)
+    noise = rng.normal(0, 4, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def _png_bytes(image):
+    ok, buf = cv2.imencode('.png', image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                           [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+    return len(buf)
+
+
+def run_benchmark(paths, binarize_output=False, repeat=3):
+    """
+    各画像(とそれをもとに作った撮影画像)について、OCRに渡す画素数・バイト数(配列とPNG)を前処理の前後で比べる。
+    """
+    preprocessor = OCRPreprocessor(binarize_output=binarize_output)
+    rows = [f"{'image':<28}{'pixels':>22}{'array KB':>20}{'PNG KB':>18}{'angle':>8}{'ms':>8}"]
+    for path in paths:
+        image = OCRPreprocessor.load(path)
+        name = os.path.basename(path)
+        samples = [(name, image), (f"{name} (camera 4000x3000)", synthetic_frame(image, angle=4.0)),
+                   (f"{name} (camera -7deg)", synthetic_frame(image, angle=-7.0, zoom=2.0, frame_size=(3000, 2400)))]
+        for label, frame in samples:
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out, info = preprocessor(frame)
+                best = min(best, time.perf_counter() - start)
+            before_px, after_px = frame.shape[0] * frame.shape[1], out.shape[0] * out.shape[1]
+            rows.append(f"{label:<28}{before_px:>10} → {after_px:>9}"
+                        f"{frame.nbytes / 1024:>9.0f} → {out.nbytes / 1024:>7.0f}"
+                        f"{_png_bytes(frame) / 1024:>8.0f} → {_png_bytes(out) / 1024:>6.0f}"
+                        f"{info['angle']:>+8.1f}{best * 1000:>8.1f}")
+    return '\n'.join(rows)
+
+
+# ----------------------------------------------------
+# メイン実行ブロック
+# ----------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OCRの前に受信画像を小さくする前処理")
+    parser.add_argument('images', nargs='*', help="処理する画像(--benchmark で省略時は test1.png)")
+    parser.add_argument('-o', '--output', help="処理後の画像の保存先(画像を1つ指定した場合)")
+    parser.add_argument('--target-text-height', type=int, default=TARGET_TEXT_HEIGHT,
+                        help="OCRに渡す画像での文字の高さ[画素]")
+    parser.add_argument('--binarize', action='store_true', help="大津の方法で二値化する")
+    parser.add_argument('--no-deskew', action='store_true', help="傾きを補正しない")
+    parser.add_argument('--benchmark', action='store_true', help="前処理の前後の画素数・バイト数を比べる")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(run_benchmark(args.images or [SAMPLE_IMAGE], args.binarize), file=sys.stderr)
+        sys.exit(0)
+    if not args.images:
+        parser.error("処理する画像を指定してください。")
+
+    preprocessor = OCRPreprocessor(args.target_text_height, args.binarize, not args.no_deskew)
+    for path in args.images:
+        out, info = preprocessor(OCRPreprocessor.load(path))
+        print(f"{os.path.basename(path)}: {format_info(info)}", file=sys.stderr)
+        if args.output and len(args.images) == 1:
+            OCRPreprocessor.save(args.output, out)
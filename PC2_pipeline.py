@@ -0,0 +1,428 @@
+# PC2の処理(画像受信 → OCR → 点字信号変換 → PC3への送信)を自動でつなぐパイプライン。
+# これまでは、受信した画像に対して yomitoku・md_to_binary.py を手で実行し、
+# PC2_processing_Tenji_Server.pde で送信していたため、ページ同士の処理を重ねられなかった。
+#
+# ここでは OCR・変換・送信をそれぞれ別スレッドの段(ステージ)にし、段と段の間を上限付きのキューでつなぐ。
+# ページNを変換・送信している間に、ページN+1のOCRを進められる。
+# キューが一杯になると前の段が待つので、処理が追いつかなくても未処理のページが溜まり続けることはない。
+#
+# 画像の入力元:
+#   * 画像ファイルのパスを指定          → 指定した画像を処理して終了
+#   * --watch                             → received_imgs/ を監視し、新しい(更新された)画像を処理
+#   * --ingest                            → PC2_img_server.py の受信サーバーを起動し、受信した画像を処理
+# 前処理(--preprocess):
+#   * OCRの前に PC2_ocr_preprocess.py で画像を小さくする(グレースケール化・文字の範囲の切り出し・傾き補正・縮小)。
+#     --ingest では受信した画像の配列をそのまま前処理する
+# OCR(--ocr):
+#   * yomitoku                            → yomitoku コマンドを実行(ページごとに一時ディレクトリへ出力)
+#   * stub                                → 決まったMarkdownを返す(yomitokuのない環境での動作確認用)
+# 送信先(--sink):
+#   * stdout                              → 標準出力に1ページ1行で出力(-o 指定時はページごとのファイル)
+#   * tenji                               → PC2_tenji_server.py の配信サーバー(ポート12345)でPC3へ配信
+#                                           (--delta で、撮影し直したページは変わったセルだけを送る)
+#
+# 使用法:
+#   python PC2_pipeline.py --watch --ocr yomitoku --sink tenji
+#   python PC2_pipeline.py --ingest --ocr yomitoku --sink tenji
+#   python PC2_pipeline.py --ingest --preprocess --ocr yomitoku --sink tenji
+#   python PC2_pipeline.py PC2_processing_Server/received_imgs/test1.png --ocr stub
+
+import os
+import sys
+import glob
+import time
+import queue # スレッド間でデータを受け渡すためのキュー
+import asyncio
+import argparse
+import shutil
+import tempfile
+import threading
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, 'conversion'))
+
+from md_to_binary import OUTPUT_FORMATS, get_converter, markdown_to_signals, encode_signals, print_debug_info
+from batch_convert import page_sort_key, write_page
+from PC2_tenji_server import TenjiBroadcastServer, format_stats, start_in_thread, stop_thread
+
+# --- 設定 ---
+WATCH_DIR = os.path.join(BASE_DIR, "PC2_processing_Server", "received_imgs")
+STUB_MARKDOWN = os.path.join(BASE_DIR, "results", "PBL_imgproc2_test1_p1.md")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+TENJI_PORT = 12345 # PC2_processing_Tenji_Server.pde と同じポート番号
+QUEUE_SIZE = 2     # 各段の間のキューに溜められるページ数
+POLL_INTERVAL = 0.5 # 監視するディレクトリを確認する間隔[秒]
+
+_STOP = object() # パイプラインの終了を後ろの段に伝えるための目印
+
+
+class Page:
+    """
+    パイプラインを流れる1ページ分のデータ。各段の処理結果と処理時間を持つ。
+    """
+
+    def __init__(self, number, image_path, image=None):
+        self.number = number
+        self.image_path = image_path
+        self.image = image        # 受信した画像の配列(あれば前処理でファイルを読み直さない)
+        self.ocr_path = None      # 前処理した画像の一時ファイル(前処理をしない場合は image_path をOCRする)
+        self.markdown = None
+        self.output_data = None
+        self.submitted = time.perf_counter()
+        self.timings = {} # 段の名前 → 処理時間[秒]
+        self.error = None
+
+
+# ----------------------------------------------------
+# OCR
+# ----------------------------------------------------
+class YomitokuOCR:
+    """
+    yomitoku コマンドでOCRを行う。出力先はページごとの一時ディレクトリにし、
+    同時に処理している他のページの結果と混ざらないようにする。
+    """
+
+    def __init__(self, command='yomitoku', extra_args=('-v', '--figure'), results_dir=None):
+        self.command = command
+        self.extra_args = list(extra_args)
+        self.results_dir = results_dir # 指定した場合は、OCR結果のMarkdownをここにもコピーする
+
+    def __call__(self, image_path):
+        with tempfile.TemporaryDirectory() as output_dir:
+            cmd = [self.command, image_path, '-f', 'md', '-o', output_dir] + self.extra_args
+            try:
+                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            except subprocess.CalledProcessError as e:
+                # 終了コードだけでは原因がわからないので、yomitokuのエラー出力をメッセージに含める
+                detail = e.stderr.decode(errors='replace').strip() if e.stderr else ''
+                raise RuntimeError(f"yomitokuが終了コード{e.returncode}で終了しました: {image_path}"
+                                   + (f"\n{detail}" if detail else '')) from e
+            md_paths = sorted(glob.glob(os.path.join(output_dir, '*.md')), key=page_sort_key)
+            if not md_paths:
+                raise RuntimeError(f"yomitokuの出力(Markdown)が見つかりません: {image_path}")
+            contents = []
+            for path in md_paths:
+                with open(path, 'r', encoding='utf-8') as f:
+                    contents.append(f.read())
+                if self.results_dir is not None:
+                    os.makedirs(self.results_dir, exist_ok=True)
+                    shutil.copy2(path, self.results_dir)
+        return '\n'.join(contents)
+
+
+class StubOCR:
+    """
+    OCRの代わりに決まったMarkdownを返す(yomitokuのない環境での動作確認用)。
+    delay を指定すると、OCRにかかる時間を模擬して待つ。
+    """
+
+    def __init__(self, markdown, delay=0.0):
+        self.markdown = markdown
+        self.delay = delay
+
+    @classmethod
+    def from_file(cls, path, delay=0.0):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(f.read(), delay)
+
+    def __call__(self, image_path):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.markdown
+
+
+# ----------------------------------------------------
+# 送信先
+# ----------------------------------------------------
+class PageWriterSink:
+    """
+    変換結果を標準出力(1ページ1行)またはページごとのファイルに書き出す。
+    """
+
+    def __init__(self, output_format='ascii', output_dir=None):
+        self.output_format = output_format
+        self.output_dir = output_dir
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def __call__(self, page):
+        write_page(page.image_path, page.output_data, self.output_format, self.output_dir)
+
+    def close(self):
+        pass
+
+
+class TenjiSink:
+    """
+    PC2_tenji_server.py の配信サーバーを別スレッドで起動し(ポート12345, PC3_Tenji_Client.pde がそのまま接続できる)、
+    変換結果(バイナリ信号の文字列)を接続中のすべてのクライアントへ配信する。
+    受信の遅いクライアントがいても、配信サーバーのキューに入れるだけなのでパイプラインは止まらない。
+    delta_format(変換結果の形式)を指定すると、クライアントごとに前回送ったページとの差分だけを送る。
+    """
+
+    def __init__(self, host='0.0.0.0', port=TENJI_PORT, ingest_port=None, delta_format=None):
+        self.server = TenjiBroadcastServer(delta_format=delta_format)
+        self.loop = start_in_thread(self.server, host, port, ingest_port)
+        print_debug_info("点字信号配信サーバー", f"{host}:{port} で待機中")
+
+    def __call__(self, page):
+        count = self.server.publish_threadsafe(page.output_data)
+        if count == 0:
+            print(f"ページ{page.number}: 接続中のクライアントがないため送信しませんでした"
+                  f"(次に接続したクライアントに送ります)。", file=sys.stderr)
+
+    def close(self):
+        for stats in self.server.stats():
+            print(format_stats(stats), file=sys.stderr)
+        stop_thread(self.server, self.loop) # キューに残っている文書を送り終えてから止める
+
+
+# ----------------------------------------------------
+# パイプライン本体
+# ----------------------------------------------------
+class Pipeline:
+    """
+    OCR → 変換 → 送信 の3段を、上限付きのキューでつないだスレッドで実行する。
+    preprocess(PC2_ocr_preprocess.OCRPreprocessor)を指定すると、OCRの前に画像を小さくする段を加える。
+    submit() で画像を投入し、close() で投入済みのページをすべて処理し終えるまで待つ。
+    """
+
+    def __init__(self, ocr, sink, output_format='ascii', queue_size=QUEUE_SIZE, preprocess=None):
+        self.ocr = ocr
+        self.sink = sink
+        self.output_format = output_format
+        self.preprocess = preprocess
+        self.stages = [
+            ('ocr', self._run_ocr),
+            ('convert', self._run_convert),
+            ('deliver', self._run_deliver),
+        ]
+        if preprocess is not None:
+            self.stages.insert(0, ('preprocess', self._run_preprocess))
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in self.stages]
+        self.threads = []
+        self.finished = [] # 処理が終わったページ(集計用)
+        self._count = 0
+        self._count_lock = threading.Lock()
+
+    def start(self):
+        get_converter().do("変換") # 最初のページの変換が辞書の読み込みで遅くならないよう、先に読み込んでおく
+        for i, (name, func) in enumerate(self.stages):
+            out_queue = self.queues[i + 1] if i + 1 < len(self.queues) else None
+            thread = threading.Thread(target=self._stage_loop, args=(name, func, self.queues[i], out_queue),
+                                      name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def submit(self, image_path, image=None):
+        """
+        画像を1枚投入する。最初の段のキューが一杯のときは空くまで待つ。
+        image(RGBの配列)を渡すと、前処理の段で画像ファイルを読み直さずに済む。
+        """
+        with self._count_lock:
+            self._count += 1
+            page = Page(self._count, image_path, image)
+        self.queues[0].put(page)
+        return page
+
+    def close(self):
+        self.queues[0].put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.sink.close()
+
+    def _stage_loop(self, name, func, in_queue, out_queue):
+        while True:
+            page = in_queue.get()
+            if page is _STOP:
+                if out_queue is not None:
+                    out_queue.put(_STOP)
+                return
+            if page.error is None:
+                start = time.perf_counter()
+                try:
+                    func(page)
+                except Exception as e:
+                    page.error = f"{name}: {e}"
+                    print(f"ページ{page.number}({page.image_path}) {name}で失敗: {e}", file=sys.stderr)
+                page.timings[name] = time.perf_counter() - start
+            if out_queue is not None:
+                out_queue.put(page)
+            else:
+                self._finish(page)
+
+    def _run_preprocess(self, page):
+        image = page.image if page.image is not None else self.preprocess.load(page.image_path)
+        page.image = None # 受信画像のメモリは早めに解放する
+        reduced, info = self.preprocess(image)
+        fd, page.ocr_path = tempfile.mkstemp(prefix='ocr_', suffix='.png')
+        os.close(fd)
+        try:
+            self.preprocess.save(page.ocr_path, reduced)
+        except Exception:
+            # 保存に失敗したページはOCRの段で処理されない(一時ファイルも消されない)ので、ここで消す
+            os.remove(page.ocr_path)
+            page.ocr_path = None
+            raise
+        print(f"ページ{page.number} 前処理: {self.preprocess.describe(info)}", file=sys.stderr)
+
+    def _run_ocr(self, page):
+        try:
+            page.markdown = self.ocr(page.ocr_path or page.image_path)
+        finally:
+            if page.ocr_path is not None:
+                os.remove(page.ocr_path)
+                page.ocr_path = None
+
+    def _run_convert(self, page):
+        signals = markdown_to_signals(page.markdown)
+        page.output_data = encode_signals(signals, self.output_format)
+
+    def _run_deliver(self, page):
+        self.sink(page)
+
+    def _finish(self, page):
+        latency = time.perf_counter() - page.submitted
+        self.finished.append(page)
+        detail = ', '.join(f"{name}={sec:.2f}秒" for name, sec in page.timings.items())
+        status = "失敗" if page.error else "完了"
+        print(f"ページ{page.number} {status}: {os.path.basename(page.image_path)} "
+              f"(投入から{latency:.2f}秒: {detail})", file=sys.stderr)
+
+
+# ----------------------------------------------------
+# 画像の入力元
+# ----------------------------------------------------
+def watch_directory(directory, submit, stop_event, include_existing=False, interval=POLL_INTERVAL):
+    """
+    ディレクトリを定期的に確認し、新しく置かれた画像・更新された画像を submit() に渡す。
+    書き込み途中のファイルを読まないよう、サイズと更新時刻が1回分の確認の間変わらなかったものだけを渡す。
+    PC2_processing_Server.pde のように同じ名前(test1.png)で上書きされる場合も、更新されるたびに処理する。
+    """
+    seen = {}    # パス → 処理済みの (更新時刻, サイズ)
+    pending = {} # パス → 前回の確認で見つけた (更新時刻, サイズ)
+    first = True
+    while not stop_event.is_set():
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name) if os.path.isdir(directory) else []:
+            if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            state = (stat.st_mtime_ns, stat.st_size)
+            if first and not include_existing:
+                seen[entry.path] = state # 起動時にすでにあった画像は処理しない
+                continue
+            if seen.get(entry.path) == state:
+                continue
+            if pending.get(entry.path) == state:
+                del pending[entry.path]
+                seen[entry.path] = state
+                submit(entry.path)
+            else:
+                pending[entry.path] = state
+        first = False
+        stop_event.wait(interval)
+
+
+def run_ingest_server(pipeline, port, output_dir=WATCH_DIR, continuous=False):
+    """
+    PC2_img_server.py の受信サーバーを別スレッドのイベントループで起動し、受信した画像を保存してから投入する。
+    continuous=True なら、1枚受信するたびに次の画像の送信を指示する。
+    Enterキーを押すと、接続中のすべてのクライアントに撮影画像の送信を指示する。
+    """
+    from PC2_img_server import ImageServer, request_on_enter
+
+    server = ImageServer(output_dir=output_dir, continuous=continuous)
+
+    def on_frame(image, client_id, frame_id):
+        pipeline.submit(server.save_frame(image, client_id, frame_id), image)
+
+    server.on_frame = on_frame
+
+    def run():
+        async def serve():
+            await server.start(port=port)
+            request_on_enter(server, asyncio.get_running_loop())
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+
+    threading.Thread(target=run, name="ingest-server", daemon=True).start()
+    print_debug_info("画像受信サーバー", f"ポート{port}で待機中 (保存先: {output_dir}, Enterキーで撮影画像を要求)")
+    return server
+
+
+# ----------------------------------------------------
+# メイン実行ブロック
+# ----------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="画像受信 → OCR → 点字信号変換 → 送信 を自動で行うパイプライン")
+    parser.add_argument('images', nargs='*', help="処理する画像ファイル(--watch / --ingest を使わない場合)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--watch', nargs='?', const=WATCH_DIR, default=None, metavar='DIR',
+                        help=f"画像が置かれるディレクトリを監視する(省略時: {WATCH_DIR})")
+    parser.add_argument('--include-existing', action='store_true', help="--watch の起動時にすでにある画像も処理する")
+    source.add_argument('--ingest', nargs='?', const=5554, type=int, default=None, metavar='PORT',
+                        help="画像受信サーバーを起動し、受信した画像を処理する(省略時のポート: 5554)")
+    parser.add_argument('--continuous', action='store_true', help="--ingest で1枚受信するたびに次の画像を要求する")
+    parser.add_argument('--ocr', choices=('yomitoku', 'stub'), default='yomitoku', help="OCRの方法")
+    parser.add_argument('--stub-markdown', default=STUB_MARKDOWN, help="--ocr stub で返すMarkdownファイル")
+    parser.add_argument('--stub-delay', type=float, default=0.0, help="--ocr stub でOCRの時間を模擬する待ち時間[秒]")
+    parser.add_argument('--results-dir', default=None, help="yomitokuのOCR結果(Markdown)の保存先")
+    parser.add_argument('--sink', choices=('stdout', 'tenji'), default='stdout', help="変換結果の送信先")
+    parser.add_argument('-o', '--output-dir', default=None, help="--sink stdout でページごとのファイルに出力する場合の出力先")
+    parser.add_argument('--tenji-port', type=int, default=TENJI_PORT, help="--sink tenji の待ち受けポート")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='ascii', help="出力形式")
+    parser.add_argument('--delta', action='store_true',
+                        help="--sink tenji で、撮影し直したページは変わったセルだけを送る(ESP32_Jan9.ino の差分更新)")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help="各段の間のキューに溜められるページ数")
+    parser.add_argument('--preprocess', action='store_true',
+                        help="OCRの前に画像を小さくする(グレースケール化・文字の範囲の切り出し・傾き補正・縮小)")
+    parser.add_argument('--target-text-height', type=int, default=None,
+                        help="--preprocess で縮小後の文字の高さ[画素](省略時: PC2_ocr_preprocess.py の既定値)")
+    parser.add_argument('--binarize', action='store_true', help="--preprocess で二値化もする")
+    args = parser.parse_args()
+
+    if not args.images and args.watch is None and args.ingest is None:
+        parser.error("画像ファイル、--watch、--ingest のいずれかを指定してください。")
+
+    if args.ocr == 'stub':
+        ocr = StubOCR.from_file(args.stub_markdown, args.stub_delay)
+    else:
+        ocr = YomitokuOCR(results_dir=args.results_dir)
+    if args.sink == 'tenji':
+        sink = TenjiSink(port=args.tenji_port, delta_format=args.format if args.delta else None)
+        if args.format == 'packed' and not args.delta:
+            # packed 形式では改行(0x0a)もセルの値なので、改行区切りの PC3_Tenji_Client.pde には送れない
+            print_debug_info("注意", "packed 形式は長さ付きの形式(FRAMED)で接続したクライアントにだけ配信します")
+    else:
+        sink = PageWriterSink(args.format, args.output_dir)
+
+    preprocess = None
+    if args.preprocess:
+        from PC2_ocr_preprocess import OCRPreprocessor, TARGET_TEXT_HEIGHT
+        preprocess = OCRPreprocessor(args.target_text_height or TARGET_TEXT_HEIGHT, args.binarize)
+
+    pipeline = Pipeline(ocr, sink, args.format, args.queue_size, preprocess).start()
+    start = time.perf_counter()
+    try:
+        for image_path in args.images:
+            pipeline.submit(image_path)
+        if args.watch is not None:
+            print_debug_info("監視中", args.watch)
+            watch_directory(args.watch, pipeline.submit, threading.Event(), args.include_existing)
+        elif args.ingest is not None:
+            run_ingest_server(pipeline, args.ingest, continuous=args.continuous)
+            threading.Event().wait() # Ctrl+Cで終了するまで受信を続ける
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.close()
+
+    finished = pipeline.finished
+    failed = [page for page in finished if page.error]
+    elapsed = time.perf_counter() - start
+    print_debug_info("パイプライン結果",
+                     f"{len(finished) - len(failed)}ページ完了 / {len(failed)}ページ失敗 / {elapsed:.2f}秒")
+    if failed:
+        sys.exit(1)
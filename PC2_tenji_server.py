@@ -0,0 +1,487 @@
+# 変換した点字信号をPC3(点字デバイスにつながるクライアント)へ配信するPythonサーバー。
+# PC2_processing_Tenji_Server.pde の置き換えで、PC3_Tenji_Client.pde はそのまま接続できる(ポート12345)。
+#
+# Processing版との違い:
+#   * 送る文字列が決まった3つ(SendMsg)ではなく、変換段階(PC2_pipeline.py や md_to_binary.py)から受け取った文書。
+#   * 複数のクライアント(点字デバイス)に同じ文書を配信する。
+#   * クライアントごとに上限付きの送信キューを持ち、受信の遅いクライアントがいても他のクライアントへの配信は止まらない。
+#     キューが一杯になったら古い文書から捨てる(点字デバイスで読むのは最新の文書のため)。
+#     一定時間(--send-timeout)送信が進まないクライアントは切断する。
+#   * クライアントごとの送信量・送信速度・キューに溜まっている文書の数を定期的に標準エラー出力に表示する。
+#
+# 配信の形式(クライアント → サーバーの最初の1行で選ぶ):
+#   * 何も送らない(PC3_Tenji_Client.pde)  → 文書 + 改行('\n')。PC3はそのままESP32へ送れる
+#   * "FRAMED\n" を送る                   → [文書の長さ 4バイト(ビッグエンディアン)][文書] (文書の区切りが確実にわかる)
+# 従来の形式では改行が文書の区切りになるため、改行(0x0a)を含む文書は送らない。
+# packed 形式(1セル1バイト)では 0x0a もセルの値なので、packed 形式の文書は長さ付きの形式のクライアントにだけ届く。
+# 接続直後に、最後に配信した文書を送る(--no-replay で無効)。
+#
+# 差分更新(--delta):
+#   * 文書(--format の形式の点字信号)をセル列に戻し、クライアントごとに最後に送ったセル列との差分を
+#     conversion/braille_delta.py の形式(E.../F...)の1行にして送る。撮影し直したページは変わったセルだけが届き、
+#     ESP32_Jan9.ino は読んでいた位置を保ったまま更新する。接続直後の最初の文書は全体(F...)を送る。
+#     ESP32の再起動や取りこぼしに備えて、差分を一定回数・一定時間送ったら全体を送り直す(braille_delta.DeltaEncoder)。
+#   * メッセージは ASCII 文字だけなので、packed 形式の文書も従来の形式のクライアントへ送れる。
+#
+# 文書の投入:
+#   * 同じプロセスから publish() を呼ぶ(PC2_pipeline.py --sink tenji)
+#   * 投入用ポート(既定 127.0.0.1:12346)に [文書の長さ 4バイト][文書] を送る。
+#     サーバーは文書ごとに、配信したクライアントの数(4バイト)を返す。
+#
+# 使用法:
+#   python PC2_tenji_server.py                                        # ポート12345で配信、12346で投入を待つ
+#   python conversion/md_to_binary.py results/xxx.md | python PC2_tenji_server.py --publish -
+#   python conversion/md_to_binary.py results/xxx.md --format packed | python PC2_tenji_server.py --publish - --packed
+#   python PC2_tenji_server.py --delta --format ascii                 # 差分更新で配信
+#   python PC2_tenji_server.py --selftest                             # ローカルのクライアントで動作確認
+
+import os
+import sys
+import time
+import struct
+import asyncio
+import argparse
+import itertools
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, 'conversion'))
+
+from conversion_protocol import OUTPUT_FORMATS # pykakasiを読み込まずに出力形式の一覧を使う
+
+# --- 設定 ---
+DEFAULT_PORT = 12345 # PC2_processing_Tenji_Server.pde と同じポート番号
+INGEST_HOST = '127.0.0.1' # 文書の投入は同じPC(PC2)内からのみ受け付ける
+INGEST_PORT = 12346
+QUEUE_SIZE = 8 # クライアントごとの送信キューに溜められる文書の数
+SEND_TIMEOUT = 10.0 # これより長く送信が進まないクライアントは切断する[秒]
+HELLO_TIMEOUT = 0.5 # 接続直後に "FRAMED\n" を待つ時間[秒]。届かなければ従来の形式で送る
+STATS_INTERVAL = 10.0 # クライアントごとの統計を表示する間隔[秒]
+MAX_DOCUMENT_BYTES = 64 * 1024 * 1024 # 投入ポートで受け付ける文書の最大サイズ
+
+HELLO_FRAMED = b'FRAMED\n'
+LENGTH_HEADER = struct.Struct('>I') # 文書の長さ(conversion/conversion_protocol.py と同じ4バイト, ビッグエンディアン)
+MODE_RAW = 'raw'       # 文書 + 改行(PC3_Tenji_Client.pde)
+MODE_FRAMED = 'framed' # 長さ + 文書
+
+
+class DisplayClient:
+    """
+    接続中の1つのクライアント(点字デバイス)。送信キューと送信の統計を持つ。
+    """
+
+    def __init__(self, client_id, writer, queue_size, encoder=None):
+        self.client_id = client_id
+        self.writer = writer
+        self.encoder = encoder # 差分更新のとき、このクライアントに最後に送ったセル列を覚える braille_delta.DeltaEncoder
+        self.peer = writer.get_extra_info('peername')
+        self.mode = MODE_RAW
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = time.monotonic()
+        self.documents = 0  # 送信した文書の数
+        self.bytes_sent = 0
+        self.dropped = 0    # キューが一杯で捨てた文書の数
+        self.refused = 0    # 従来の形式では送れない(改行を含む)ため送らなかった文書の数
+        self.unchanged = 0  # 差分更新で、前回送ったものと同じだったため送らなかった文書の数
+        self.max_depth = 0  # キューに溜まった文書の数の最大値
+
+    def offer(self, document):
+        """
+        文書を送信キューに入れる。キューが一杯なら一番古い文書を捨てる(待たないので他のクライアントを止めない)。
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.dropped += 1
+        self.queue.put_nowait(document)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def accepts(self, document):
+        """
+        この形式で文書を送れるか。従来の形式では改行が文書の区切りになるため、改行を含む文書は送れない
+        (差分更新のメッセージは改行を含まないので、常に送れる)。
+        """
+        return self.encoder is not None or self.mode == MODE_FRAMED or b'\n' not in document
+
+    def encode(self, document):
+        """
+        文書を送信するバイト列にする。差分更新で前回送ったものと同じなら None を返す(送る必要がない)。
+        """
+        if self.encoder is not None:
+            message = self.encoder.update(self.client_id, document) # document はセル列(publish() で変換済み)
+            if message is None:
+                return None
+            document = message.encode('ascii')
+        if self.mode == MODE_FRAMED:
+            return LENGTH_HEADER.pack(len(document)) + document
+        return document + b'\n'
+
+    def stats(self):
+        """
+        送信の統計を辞書で返す。
+        """
+        elapsed = max(time.monotonic() - self.connected_at, 1e-9)
+        return {
+            'client': self.client_id,
+            'peer': f"{self.peer[0]}:{self.peer[1]}" if self.peer else '?',
+            'mode': self.mode,
+            'documents': self.documents,
+            'bytes': self.bytes_sent,
+            'bytes_per_sec': round(self.bytes_sent / elapsed, 1),
+            'queue': self.queue.qsize(),
+            'max_queue': self.max_depth,
+            'dropped': self.dropped,
+            'refused': self.refused,
+            'delta': self.encoder is not None,
+            'unchanged': self.unchanged,
+        }
+
+
+def format_stats(stats):
+    return (f"クライアント{stats['client']} ({stats['peer']}, {stats['mode']}): "
+            f"送信 {stats['documents']}件 / {stats['bytes'] / 1024:.1f}KB ({stats['bytes_per_sec'] / 1024:.1f}KB/秒), "
+            f"キュー {stats['queue']}件 (最大 {stats['max_queue']}件), 破棄 {stats['dropped']}件, "
+            f"形式が合わず未送信 {stats['refused']}件"
+            + (f", 変更なし {stats['unchanged']}件" if stats['delta'] else ""))
+
+
+class TenjiBroadcastServer:
+    """
+    点字信号の文書を、接続中のすべてのクライアントへ配信するサーバー。
+    publish() はイベントループのスレッドから呼ぶ(別スレッドからは publish_threadsafe())。
+    delta_format に文書の形式(OUTPUT_FORMATS のいずれか)を指定すると、差分更新で配信する。
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE, send_timeout=SEND_TIMEOUT, replay_latest=True, delta_format=None):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.replay_latest = replay_latest
+        self.delta_format = delta_format
+        if delta_format is not None:
+            from braille_delta import DeltaEncoder, document_to_cells # md_to_binary(pykakasi)を読み込むため、使うときだけ
+            self._new_encoder = DeltaEncoder
+            self._to_cells = document_to_cells
+        self.clients = {}
+        self.latest = None   # 最後に配信した文書(新しく接続したクライアントに送る)
+        self.published = 0
+        self.loop = None
+        self.servers = []
+        self._ids = itertools.count(1)
+
+    async def start(self, host='0.0.0.0', port=DEFAULT_PORT, ingest_host=INGEST_HOST, ingest_port=INGEST_PORT):
+        """
+        配信用のポートと(ingest_port が None でなければ)投入用のポートで待ち受けを始める。
+        """
+        self.loop = asyncio.get_running_loop()
+        self.servers.append(await asyncio.start_server(self._handle_display, host, port))
+        if ingest_port is not None:
+            self.servers.append(await asyncio.start_server(self._handle_ingest, ingest_host, ingest_port))
+        return self
+
+    def ports(self):
+        """
+        実際に待ち受けているポート番号を (配信用, 投入用) の順で返す(ポート0を指定した場合の確認用)。
+        """
+        return [server.sockets[0].getsockname()[1] for server in self.servers]
+
+    # --- 配信 ---
+    def publish(self, document):
+        """
+        文書(bytes)を接続中のすべてのクライアントの送信キューに入れ、入れたクライアントの数を返す。
+        改行を含む文書(packed 形式など)は、従来の形式のクライアントには送らない(数にも含めない)。
+        差分更新のときは、文書をセル列に戻してからキューに入れる(戻せない文書は配信せずに0を返す)。
+        """
+        if self.delta_format is not None:
+            try:
+                document = self._to_cells(document, self.delta_format)
+            except ValueError as e:
+                print(f"{self.delta_format} 形式の点字信号として読めない文書は配信しません: {e}", file=sys.stderr)
+                return 0
+        self.latest = document
+        self.published += 1
+        count = 0
+        for client in list(self.clients.values()):
+            if self._offer(client, document):
+                count += 1
+        return count
+
+    @staticmethod
+    def _offer(client, document):
+        if not client.accepts(document):
+            client.refused += 1
+            print(f"クライアント{client.client_id}: 改行を含む文書は従来の形式では送れないため送りません"
+                  f"(packed 形式は長さ付きの形式で受信してください)", file=sys.stderr)
+            return False
+        client.offer(document)
+        return True
+
+    def publish_threadsafe(self, document):
+        """
+        別のスレッドから publish() を呼び、入れたクライアントの数を返す。
+        """
+        async def publish():
+            return self.publish(document)
+        return asyncio.run_coroutine_threadsafe(publish(), self.loop).result()
+
+    def stats(self):
+        return [client.stats() for client in self.clients.values()]
+
+    async def report_stats(self, interval=STATS_INTERVAL):
+        """
+        interval 秒ごとに、クライアントごとの統計を標準エラー出力に表示し続ける。
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for stats in self.stats():
+                print(format_stats(stats), file=sys.stderr)
+
+    async def close(self, flush_timeout=SEND_TIMEOUT):
+        """
+        待ち受けを止め、送信キューに残っている文書を送り終えるまで(最大 flush_timeout 秒)待ってから切断する。
+        """
+        for server in self.servers:
+            server.close()
+        pending = [client.queue.join() for client in self.clients.values()]
+        if pending:
+            try:
+                await asyncio.wait_for(asyncio.gather(*pending), flush_timeout)
+            except asyncio.TimeoutError:
+                pass
+        for client in list(self.clients.values()):
+            client.writer.close()
+
+    # --- クライアントごとの処理 ---
+    async def _handle_display(self, reader, writer):
+        encoder = self._new_encoder() if self.delta_format is not None else None
+        client = DisplayClient(next(self._ids), writer, self.queue_size, encoder)
+        print(f"クライアント{client.client_id}({client.peer})と接続", file=sys.stderr)
+        try:
+            hello = await asyncio.wait_for(reader.readline(), HELLO_TIMEOUT)
+        except asyncio.TimeoutError:
+            hello = None # 何も送ってこない = PC3_Tenji_Client.pde
+        except ConnectionError:
+            hello = b''
+        if hello == b'':
+            writer.close()
+            return
+        if hello == HELLO_FRAMED:
+            client.mode = MODE_FRAMED
+
+        self.clients[client.client_id] = client
+        if self.replay_latest and self.latest is not None:
+            self._offer(client, self.latest)
+        sender = asyncio.create_task(self._send_loop(client))
+        closed = asyncio.create_task(self._wait_closed(reader))
+        done, _ = await asyncio.wait({sender, closed}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (sender, closed):
+            task.cancel()
+        self.clients.pop(client.client_id, None)
+        if sender in done and not sender.cancelled() and sender.exception() is not None:
+            print(f"クライアント{client.client_id}: {sender.exception()} → 切断します", file=sys.stderr)
+        writer.close()
+        print(f"クライアント{client.client_id}: 切断 ({format_stats(client.stats())})", file=sys.stderr)
+
+    async def _send_loop(self, client):
+        while True:
+            document = await client.queue.get()
+            data = client.encode(document)
+            if data is None: # 差分更新で、前回送ったものと変わらない
+                client.unchanged += 1
+                client.queue.task_done()
+                continue
+            client.writer.write(data)
+            try:
+                # 送信バッファが一杯のときはここで待つ(このクライアントのキューにだけ文書が溜まる)
+                await asyncio.wait_for(client.writer.drain(), self.send_timeout)
+            except asyncio.TimeoutError:
+                raise ConnectionError(f"{self.send_timeout}秒以上送信が進みません")
+            finally:
+                client.queue.task_done()
+            client.documents += 1
+            client.bytes_sent += len(data)
+
+    @staticmethod
+    async def _wait_closed(reader):
+        """
+        クライアントが切断するまで待つ(クライアントから届くデータは読み捨てる)。
+        """
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+
+    async def _handle_ingest(self, reader, writer):
+        try:
+            while True:
+                try:
+                    (length,) = LENGTH_HEADER.unpack(await reader.readexactly(LENGTH_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    return # 投入側が接続を閉じた
+                if length > MAX_DOCUMENT_BYTES:
+                    print(f"投入された文書が大きすぎます: {length}バイト → 切断します", file=sys.stderr)
+                    return
+                count = self.publish(await reader.readexactly(length))
+                writer.write(LENGTH_HEADER.pack(count))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def start_in_thread(server, host='0.0.0.0', port=DEFAULT_PORT, ingest_port=None):
+    """
+    server のイベントループを別スレッドで動かし、待ち受けを始めるまで待つ(PC2_pipeline.py から使う)。
+    待ち受けを始められなかった場合(ポートが使用中など)は、その例外を送出する。
+    """
+    loop = asyncio.new_event_loop()
+    started = asyncio.run_coroutine_threadsafe(
+        server.start(host, port, ingest_port=ingest_port), loop)
+    threading.Thread(target=loop.run_forever, name="tenji-server", daemon=True).start()
+    started.result()
+    return loop
+
+
+def stop_thread(server, loop, flush_timeout=SEND_TIMEOUT):
+    """
+    start_in_thread() で動かしたサーバーを、送信キューを送り終えてから止める。
+    """
+    asyncio.run_coroutine_threadsafe(server.close(flush_timeout), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+# ----------------------------------------------------
+# 投入・受信用のクライアント(PC3の代わりの動作確認にも使う)
+# ----------------------------------------------------
+async def publish_document(document, host=INGEST_HOST, port=INGEST_PORT):
+    """
+    投入用ポートへ文書を1つ送り、配信したクライアントの数を返す。
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(LENGTH_HEADER.pack(len(document)) + document)
+        await writer.drain()
+        (count,) = LENGTH_HEADER.unpack(await reader.readexactly(LENGTH_HEADER.size))
+        return count
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def read_documents(reader, framed):
+    """
+    配信された文書を1つずつ返す非同期ジェネレータ。framed=False なら改行までを1つの文書とする。
+    """
+    while True:
+        try:
+            if framed:
+                (length,) = LENGTH_HEADER.unpack(await reader.readexactly(LENGTH_HEADER.size))
+                yield await reader.readexactly(length)
+            else:
+                line = await reader.readuntil(b'\n')
+                yield line[:-1]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+
+async def selftest(num_clients=4, num_documents=20, document_bytes=256 * 1024):
+    """
+    ローカルのクライアント(PC3の代わり)で動作を確認する。
+    長さ付きの形式のクライアント・従来の形式のクライアントがすべての文書を順番どおりに受け取ること、
+    受信しないクライアントがいても他のクライアントへの配信が止まらず、そのクライアントだけが切断されることを確認する。
+    """
+    server = TenjiBroadcastServer(send_timeout=1.0, replay_latest=False)
+    await server.start('127.0.0.1', 0, ingest_port=0)
+    port, ingest_port = server.ports()
+    documents = [bytes([ord('0') + i % 2]) * document_bytes for i in range(num_documents)]
+
+    async def display(framed):
+        # 従来の形式は改行までを1つの文書として読むため、読み込みの上限を文書の大きさに合わせる
+        reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=document_bytes * 2)
+        if framed:
+            writer.write(HELLO_FRAMED)
+        received = []
+        async for document in read_documents(reader, framed):
+            received.append(document)
+            if len(received) == num_documents:
+                break
+        writer.close()
+        return received
+
+    # 接続しても受信しない(送信バッファが一杯になる)クライアント
+    stalled_reader, stalled_writer = await asyncio.open_connection('127.0.0.1', port)
+    stalled_writer.write(HELLO_FRAMED)
+    tasks = [asyncio.create_task(display(framed=i % 2 == 0)) for i in range(num_clients)]
+    await asyncio.sleep(HELLO_TIMEOUT * 2) # 全員の形式が決まるまで待つ
+
+    start = time.perf_counter()
+    for document in documents:
+        await publish_document(document, port=ingest_port)
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    for stats in server.stats():
+        print(format_stats(stats), file=sys.stderr)
+
+    ok = all(received == documents for received in results)
+    await asyncio.sleep(server.send_timeout * 2) # 受信しないクライアントが切断されるのを待つ
+    stalled_disconnected = not any(s['mode'] == MODE_FRAMED and s['documents'] < num_documents
+                                   for s in server.stats())
+    stalled_writer.close()
+    await server.close(flush_timeout=0)
+    total = num_clients * num_documents * document_bytes
+    print(f"{num_clients}クライアントへ{num_documents}件({total / 1e6:.1f}MB)を{elapsed:.2f}秒で配信 "
+          f"({total / elapsed / 1e6:.1f}MB/秒): 受信内容 {'一致' if ok else '不一致'}, "
+          f"受信しないクライアント {'切断済み' if stalled_disconnected else '未切断'}", file=sys.stderr)
+    return ok and stalled_disconnected
+
+
+# ----------------------------------------------------
+# メイン実行ブロック
+# ----------------------------------------------------
+async def main(args):
+    server = TenjiBroadcastServer(args.queue_size, args.send_timeout, not args.no_replay,
+                                  args.format if args.delta else None)
+    await server.start(args.host, args.port, ingest_port=args.ingest_port)
+    print(f"サーバ： {args.host}:{args.port} で配信, {INGEST_HOST}:{args.ingest_port} で投入を待機中",
+          file=sys.stderr)
+    await server.report_stats(args.stats_interval) # Ctrl+Cで終了するまで続ける
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="PC3へ点字信号を配信するサーバー")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--ingest-port', type=int, default=INGEST_PORT, help="文書の投入を受け付けるポート")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help="クライアントごとの送信キューの上限(文書数)")
+    parser.add_argument('--send-timeout', type=float, default=SEND_TIMEOUT,
+                        help="これより長く送信が進まないクライアントを切断する[秒]")
+    parser.add_argument('--no-replay', action='store_true', help="接続直後に最後の文書を送らない")
+    parser.add_argument('--delta', action='store_true',
+                        help="撮影し直したページは変わったセルだけを送る(ESP32_Jan9.ino の差分更新)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='ascii',
+                        help="--delta で投入される文書の形式(md_to_binary.py の --format)")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL, help="統計を表示する間隔[秒]")
+    parser.add_argument('--publish', metavar='FILE',
+                        help="起動中のサーバーへ文書を投入して終了する('-' で標準入力)")
+    parser.add_argument('--packed', action='store_true',
+                        help="--publish の文書が packed 形式であることを示す(指定しない場合は末尾の改行1つを行の終わりとして取り除く)")
+    parser.add_argument('--selftest', action='store_true', help="ローカルのクライアントで動作確認して終了する")
+    args = parser.parse_args()
+    try:
+        if args.selftest:
+            sys.exit(0 if asyncio.run(selftest()) else 1)
+        if args.publish:
+            if args.publish == '-':
+                document = sys.stdin.buffer.read()
+            else:
+                with open(args.publish, 'rb') as f:
+                    document = f.read()
+            if not args.packed and document.endswith(b'\n'):
+                document = document[:-1] # md_to_binary.py の print() が付けた行の終わり(文書の内容ではない)
+            count = asyncio.run(publish_document(document, port=args.ingest_port))
+            print(f"{len(document)}バイトを{count}クライアントへ配信しました。", file=sys.stderr)
+            sys.exit(0)
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
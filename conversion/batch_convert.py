@@ -0,0 +1,157 @@
+# yomitokuが1ページごとに出力したMarkdown(results/*_p1.md, *_p2.md, ...)をまとめて点字信号に変換する。
+# ファイルごとに md_to_binary.py を起動する代わりに、プロセスプールで複数ファイルを並列に変換する。
+# 各ワーカープロセスは起動時に一度だけkakasiのコンバータを生成し、以降のファイルで使い回す。
+#
+# 使用法:
+#   python conversion/batch_convert.py results                       # 標準出力にページ順で1行ずつ出力
+#   python conversion/batch_convert.py "results/*_p*.md" -o braille  # ページごとにファイルへ出力
+# 最後に、ページ数/秒・文字数/秒と、変換に時間がかかったファイルを標準エラー出力に表示する。
+
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor # 複数プロセスで並列に処理するためのモジュール
+
+from md_to_binary import (OUTPUT_FORMATS, clean_markdown_text, get_hiragana_converter, to_hiragana,
+                          to_braille_signals, encode_signals, print_debug_info)
+
+OUTPUT_EXTENSIONS = {'ascii': '.txt', 'packed': '.bin', 'unicode-braille': '.txt'}
+NUM_SLOWEST = 5 # 集計で表示する「時間がかかったファイル」の数
+
+_PAGE_PATTERN = re.compile(r'_p(\d+)$') # yomitokuの出力ファイル名のページ番号部分(例: xxx_p12.md)
+
+
+def page_sort_key(path):
+    """
+    ページ順に並べるためのキー。ファイル名の末尾のページ番号を数値として比較する
+    (文字列のままだと p10 が p2 より前になってしまうため)。
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = _PAGE_PATTERN.search(stem)
+    if match:
+        return (stem[:match.start()], int(match.group(1)), path)
+    return (stem, 0, path)
+
+
+def collect_markdown_files(inputs):
+    """
+    ディレクトリ・globパターン・ファイルパスの並びから、対象のMarkdownファイルをページ順に並べて返す。
+    """
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(glob.glob(os.path.join(item, '*.md')))
+        else:
+            paths.update(p for p in glob.glob(item) if os.path.isfile(p))
+    return sorted(paths, key=page_sort_key)
+
+
+def _init_worker():
+    """
+    ワーカープロセスの起動時に1回だけ呼ばれる。ひらがな変換のコンバータを生成し(kakasiの辞書の読み込みと
+    HiraganaConverterの動作確認を含む)、最初のファイルの変換時間に含まれないようにしておく。
+    """
+    get_hiragana_converter().convert("変換")
+
+
+def convert_file(path, output_format='ascii'):
+    """
+    1ファイルを変換し、(パス, 出力データ, クリーンアップ後の文字数, 変換時間[秒], エラー) を返す。
+    ワーカープロセス内で実行される。読み込みや変換に失敗した場合、出力データは None で、
+    エラーにその内容の文字列が入る(1ページの失敗でバッチ全体が止まらないように、例外は送出しない)。
+    """
+    start = time.perf_counter()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        extracted_text = clean_markdown_text(md_content)
+        braille_signals = to_braille_signals(to_hiragana(extracted_text))
+        output_data = encode_signals(braille_signals, output_format)
+    except Exception as e:
+        return path, None, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return path, output_data, len(extracted_text), time.perf_counter() - start, None
+
+
+def write_page(path, output_data, output_format, output_dir):
+    """
+    1ページ分の出力を書き出す。output_dir が None なら標準出力に1ページ1行で出力する。
+    """
+    if output_dir is None:
+        if output_format == 'packed':
+            # packedは改行もセルの値になり得るので、ページの区切りとしてページ長(4バイト)を前に付ける
+            sys.stdout.buffer.write(len(output_data).to_bytes(4, 'big') + output_data)
+        else:
+            sys.stdout.buffer.write(output_data + b'\n')
+        sys.stdout.buffer.flush()
+        return
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(output_dir, stem + OUTPUT_EXTENSIONS[output_format]), 'wb') as f:
+        f.write(output_data)
+
+
+def run_batch(paths, output_format='ascii', output_dir=None, workers=None):
+    """
+    ファイルをプロセスプールで並列に変換し、ページ順に書き出す。
+    集計結果(辞書)を返す。
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    timings = []
+    total_chars = 0
+    failed = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # map()は投入した順番で結果を返すので、変換が終わった順に関係なく出力はページ順になる
+        results = executor.map(convert_file, paths, [output_format] * len(paths))
+        for path, output_data, num_chars, elapsed, error in results:
+            if output_data is None:
+                failed.append((path, error))
+                print(f"エラー: {path} を変換できませんでした ({error})", file=sys.stderr)
+                continue
+            write_page(path, output_data, output_format, output_dir)
+            timings.append((elapsed, path))
+            total_chars += num_chars
+    wall = time.perf_counter() - start
+
+    timings.sort(reverse=True)
+    return {
+        'pages': len(timings),
+        'failed': failed,
+        'characters': total_chars,
+        'seconds': round(wall, 3),
+        'pages_per_sec': round(len(timings) / wall, 2) if wall > 0 else 0.0,
+        'chars_per_sec': round(total_chars / wall, 1) if wall > 0 else 0.0,
+        'slowest': [(os.path.basename(p), round(t, 3)) for t, p in timings[:NUM_SLOWEST]],
+    }
+
+
+# --------------------------------------------------------
+# メイン実行ブロック
+# --------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Markdownファイルをまとめて並列に点字信号へ変換する")
+    parser.add_argument('inputs', nargs='+', help="ディレクトリ、globパターン、またはMarkdownファイルのパス")
+    parser.add_argument('-o', '--output-dir', help="ページごとの出力先ディレクトリ(省略時は標準出力)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='ascii', help="出力形式")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="ワーカープロセス数(省略時はCPU数)")
+    args = parser.parse_args()
+
+    paths = collect_markdown_files(args.inputs)
+    if not paths:
+        print("エラー: 対象のMarkdownファイルが見つかりません。", file=sys.stderr)
+        sys.exit(1)
+
+    summary = run_batch(paths, args.format, args.output_dir, args.workers)
+
+    print_debug_info("バッチ変換結果",
+                     f"{summary['pages']}ページ / {summary['characters']}文字 / {summary['seconds']}秒\n"
+                     f"{summary['pages_per_sec']} ページ/秒, {summary['chars_per_sec']} 文字/秒")
+    print_debug_info("時間がかかったファイル",
+                     '\n'.join(f"{name}: {sec}秒" for name, sec in summary['slowest']))
+    if summary['failed']:
+        print_debug_info("変換に失敗したファイル", '\n'.join(f"{path}: {error}" for path, error in summary['failed']))
+        sys.exit(1)
@@ -0,0 +1,293 @@
+# 点字信号変換の各段階(Markdownクリーンアップ・ひらがな変換・点字信号変換)と全体の処理時間を測るベンチマーク。
+# Markdownクリーンアップは、md_cleanup.py の1回走査と以前の re.sub() 7回の実装も比較する。
+# ひらがな変換は、漢字の部分だけをkakasiで変換する to_hiragana() と、以前の文字列全体をkakasiで変換する実装
+# (to_hiragana_kakasi)を比較する。かな中心の文書(kana)で差が大きくなる。
+# results/PBL_imgproc2_test1_p1.md と同じ形式(見出し・<br>・リンク・画像タグを含むOCR結果)の
+# 日本語/英語/数字混じりのMarkdownを、指定したサイズ(1KB〜10MB)で生成して測定する。
+#
+# 使用法:
+#   python conversion/benchmark.py                                  # 測定して結果を表示(1KB〜1MB)
+#   python conversion/benchmark.py --sizes 1k,1m,10m                # 10MBも測定(数分〜十数分かかる)
+#   python conversion/benchmark.py --sizes 1k,100k -o bench.json    # 結果をJSONで保存
+#   python conversion/benchmark.py --baseline bench_base.json --threshold 0.2
+#     → 基準の結果より20%以上遅くなった段階があれば終了コード1で終了する
+#   python conversion/benchmark.py --save-baseline bench_base.json  # 今回の結果を基準として保存
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc # ピークメモリ使用量を測るモジュール
+
+from md_to_binary import (extract_clean_text_from_md, to_hiragana, to_hiragana_kakasi, to_braille_signals,
+                          markdown_to_signals, get_converter, get_hiragana_converter, print_debug_info)
+from md_cleanup import clean_markdown_text, clean_markdown_text_regex
+
+SAMPLE_MD = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', 'results', 'PBL_imgproc2_test1_p1.md')
+DEFAULT_SIZES = '1k,10k,100k,1m' # 10MBはひらがな変換だけで数十秒かかるため、必要なときに --sizes で指定する
+CORPUS_KINDS = ('japanese', 'english', 'mixed', 'kana')
+LARGE_CORPUS_BYTES = 1024 * 1024 # これ以上のコーパスは1回だけ測定する(ひらがな変換に時間がかかるため)
+MIN_COMPARE_SECONDS = 0.005 # 基準との比較で、これより短い処理は測定誤差が大きいので比較しない
+
+# 合成用の素材(OCR結果によく出てくる形)
+_ENGLISH_WORDS = ('Robot Operating System ROS is a set of software libraries and tools that help '
+                  'you build robot applications From drivers to state of the art algorithms and '
+                  'powerful developer tools').split()
+_JAPANESE_PHRASES = ('ロボット', 'アプリケーション', '開発', 'のための', 'ミドルウェア', 'です。',
+                     '点字', 'デバイス', 'を', '使って', '文字', '情報', 'を', '表示', 'します。',
+                     'ライブラリ', 'とツール', 'が', '提供', 'されています', '、', 'ソフトウェア',
+                     'じゃがいも', 'きょう', 'ぎゅうにゅう', 'ぱぴぷぺぽ')
+_KANA_PHRASES = tuple(p for p in _JAPANESE_PHRASES if not any('\u4e00' <= c <= '\u9fff' for c in p)) # 漢字を含まないもの
+
+
+# --------------------------------------------------------
+# コーパス生成
+# --------------------------------------------------------
+def parse_size(text):
+    """
+    '10k' や '1m' のようなサイズ指定をバイト数に変換する。
+    """
+    text = text.strip().lower()
+    units = {'k': 1024, 'm': 1024 * 1024}
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _load_sample_lines():
+    """
+    サンプルのOCR結果を行ごとに読み込む。見つからない場合は空のリストを返す。
+    """
+    try:
+        with open(SAMPLE_MD, 'r', encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def _synthetic_line(rng, kind):
+    """
+    1行分の合成テキストを作る。
+    """
+    if kind == 'english':
+        words = [rng.choice(_ENGLISH_WORDS) for _ in range(rng.randint(6, 16))]
+        line = ' '.join(words) + '.'
+    elif kind == 'japanese':
+        line = ''.join(rng.choice(_JAPANESE_PHRASES) for _ in range(rng.randint(6, 16)))
+    elif kind == 'kana':
+        line = ''.join(rng.choice(_KANA_PHRASES) for _ in range(rng.randint(6, 16)))
+    else:
+        parts = []
+        for _ in range(rng.randint(6, 14)):
+            r = rng.random()
+            if r < 0.3:
+                parts.append(str(rng.randint(0, 20260)))
+            elif r < 0.5:
+                parts.append(rng.choice(_ENGLISH_WORDS))
+            else:
+                parts.append(rng.choice(_JAPANESE_PHRASES))
+        line = ' '.join(parts)
+
+    # OCR結果と同じように、行の途中に<br>や強調・リンクを混ぜる
+    r = rng.random()
+    if r < 0.15:
+        return '# ' + line
+    if r < 0.3:
+        cut = rng.randint(1, max(1, len(line) - 1))
+        return line[:cut] + '<br>' + line[cut:]
+    if r < 0.35:
+        return f'[{line}](https://example.com/{rng.randint(0, 999)})'
+    if r < 0.4:
+        return f'<img src="figures/fig_{rng.randint(0, 99)}.png" width="200px"><br>**{line}**'
+    return line
+
+
+def generate_corpus(size_bytes, kind, seed=0):
+    """
+    指定したバイト数(UTF-8)程度のMarkdown文字列を生成する。
+    japanese・mixedではサンプルのOCR結果の行も素材として使う。
+    """
+    rng = random.Random(f"{kind}:{seed}")
+    sample_lines = _load_sample_lines() if kind in ('japanese', 'mixed') else []
+    lines = []
+    total = 0
+    while total < size_bytes:
+        if sample_lines and rng.random() < 0.5:
+            line = rng.choice(sample_lines)
+        else:
+            line = _synthetic_line(rng, kind)
+        lines.append(line)
+        lines.append('') # 段落の区切り(空行)
+        total += len(line.encode('utf-8')) + 2
+    text = '\n'.join(lines)
+    return text.encode('utf-8')[:size_bytes].decode('utf-8', errors='ignore')
+
+
+# --------------------------------------------------------
+# 測定
+# --------------------------------------------------------
+def _measure(func, repeat):
+    """
+    func() を repeat 回実行した中で最も短い時間[秒]と、1回実行したときのピークメモリ[バイト]を返す。
+    ピークメモリはtracemallocの計測で処理が遅くなるため、時間とは別に測る。
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def _end_to_end(md_path):
+    """
+    ファイルの読み込みから点字信号までの全体の処理。
+    """
+    with open(md_path, 'r', encoding='utf-8') as f:
+        return markdown_to_signals(f.read())
+
+
+def _to_hiragana_single(text):
+    """
+    to_hiragana() を、漢字の部分の変換結果を覚えていない状態から実行する
+    (繰り返し測定したときに、前回覚えた結果で速くならないようにするため)。
+    """
+    get_hiragana_converter().convert_run.cache_clear()
+    return to_hiragana(text)
+
+
+def benchmark_corpus(md_content, repeat):
+    """
+    1つのコーパスについて、各段階と全体の処理時間・ピークメモリを測る。
+    """
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.md', delete=False) as f:
+        f.write(md_content)
+        md_path = f.name
+    try:
+        clean_text = extract_clean_text_from_md(md_path)
+        hiragana_text = to_hiragana(clean_text)
+        stages = {
+            'extract_clean_text_from_md': (lambda: extract_clean_text_from_md(md_path), md_content),
+            # Markdownクリーンアップ単体: 1回走査(md_cleanup)と、以前の re.sub() 7回の比較
+            'cleanup_single_pass': (lambda: clean_markdown_text(md_content), md_content),
+            'cleanup_regex_chain': (lambda: clean_markdown_text_regex(md_content), md_content),
+            'to_hiragana': (lambda: _to_hiragana_single(clean_text), clean_text),
+            'to_hiragana_kakasi': (lambda: to_hiragana_kakasi(clean_text), clean_text),
+            'to_braille_signals': (lambda: to_braille_signals(hiragana_text), hiragana_text),
+            'end_to_end': (lambda: _end_to_end(md_path), md_content),
+        }
+        results = {}
+        for name, (func, stage_input) in stages.items():
+            seconds, peak = _measure(func, repeat)
+            input_bytes = len(stage_input.encode('utf-8'))
+            results[name] = {
+                'seconds': seconds,
+                'input_bytes': input_bytes,
+                'mb_per_sec': round(input_bytes / seconds / 1e6, 3) if seconds > 0 else None,
+                'chars_per_sec': round(len(stage_input) / seconds, 1) if seconds > 0 else None,
+                'peak_memory_bytes': peak,
+            }
+        return results
+    finally:
+        os.remove(md_path)
+
+
+def run_benchmarks(sizes, kinds, repeat, seed=0):
+    """
+    すべてのサイズ・種類のコーパスを測定し、{"<種類>-<サイズ>": {段階: 結果}} を返す。
+    """
+    get_converter().do("変換") # 辞書の読み込み時間を測定に含めないよう、先に読み込んでおく
+    results = {}
+    for kind in kinds:
+        for size_text in sizes:
+            size_bytes = parse_size(size_text)
+            md_content = generate_corpus(size_bytes, kind, seed)
+            n = 1 if size_bytes >= LARGE_CORPUS_BYTES else repeat
+            results[f"{kind}-{size_text}"] = benchmark_corpus(md_content, n)
+            print(f"測定完了: {kind}-{size_text}", file=sys.stderr)
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold, min_seconds=MIN_COMPARE_SECONDS):
+    """
+    基準の結果と比べ、処理時間が (1 + threshold) 倍を超えた段階を [(コーパス, 段階, 基準, 今回), ...] で返す。
+    基準にないコーパス・段階と、今回の処理時間が min_seconds 未満の段階は比較しない。
+    """
+    regressions = []
+    for corpus, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(corpus, {}).get(stage)
+            if base is None or result['seconds'] < min_seconds:
+                continue
+            if result['seconds'] > base['seconds'] * (1 + threshold):
+                regressions.append((corpus, stage, base['seconds'], result['seconds']))
+    return regressions
+
+
+def format_table(results):
+    """
+    結果を表形式の文字列にする。
+    """
+    rows = [f"{'corpus':<16}{'stage':<30}{'sec':>10}{'MB/s':>10}{'peak KB':>12}"]
+    for corpus, stages in results.items():
+        for stage, r in stages.items():
+            mbps = '-' if r['mb_per_sec'] is None else f"{r['mb_per_sec']:.3f}"
+            rows.append(f"{corpus:<16}{stage:<30}{r['seconds']:>10.4f}{mbps:>10}"
+                        f"{r['peak_memory_bytes'] / 1024:>12.1f}")
+    return '\n'.join(rows)
+
+
+# --------------------------------------------------------
+# メイン実行ブロック
+# --------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="点字信号変換のベンチマーク")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="コーパスのサイズ(カンマ区切り, 例: 1k,10k,1m)")
+    parser.add_argument('--kinds', default=','.join(CORPUS_KINDS), help="コーパスの種類(japanese,english,mixed,kana)")
+    parser.add_argument('--repeat', type=int, default=3, help="測定の繰り返し回数(最短時間を採用)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="結果を保存するJSONファイル")
+    parser.add_argument('--baseline', help="比較する基準の結果(JSON)")
+    parser.add_argument('--threshold', type=float, default=0.2, help="許容する処理時間の増加率(0.2 = 20%%)")
+    parser.add_argument('--min-seconds', type=float, default=MIN_COMPARE_SECONDS,
+                        help="これより短い処理は基準と比較しない[秒]")
+    parser.add_argument('--save-baseline', help="今回の結果を基準として保存するJSONファイル")
+    args = parser.parse_args()
+
+    kinds = [k for k in args.kinds.split(',') if k]
+    unknown = [k for k in kinds if k not in CORPUS_KINDS]
+    if unknown:
+        print(f"エラー: 未対応のコーパスの種類です: {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(2)
+
+    results = run_benchmarks([s for s in args.sizes.split(',') if s], kinds, args.repeat, args.seed)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    print_debug_info("ベンチマーク結果", format_table(results))
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_with_baseline(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print_debug_info(f"性能低下 (基準より{args.threshold:.0%}以上遅い)",
+                             '\n'.join(f"{c} / {s}: {b:.4f}秒 → {n:.4f}秒" for c, s, b, n in regressions))
+            sys.exit(1)
+        print_debug_info("基準との比較", "性能低下なし")
@@ -0,0 +1,230 @@
+# Markdown → ひらがな → 点字 の変換結果をディスクに保存しておくキャッシュ。
+# 同じ(またはほぼ同じ)OCR結果を再送・再変換するときに、kakasiの変換をやり直さずに済ませる。
+#
+# キャッシュの構成(既定では conversion/.braille_cache/ 以下):
+#   docs/<ハッシュ>.json  クリーンアップ後の文書1つ分の変換結果(ひらがなと点字セル)
+#   lines/<xx>.json       1行ごとのひらがな変換結果(1行だけ違うページでは、その行だけ変換し直す)。
+#                         行のハッシュの先頭2文字(xx)で256個のファイルに分け、文書単位でミスしたときに
+#                         必要なファイルだけを読み込み、新しい行を加えたファイルだけを書き直す
+#   stats.json            ヒット/ミスの累計
+# 文書のキーは「クリーンアップ後の文字列」と「変換器・点字表のバージョン」のハッシュなので、
+# 点字表やpykakasiを更新すると古い結果は自動的に使われなくなる。
+
+import os
+import json
+import hashlib # ハッシュ値(SHA-256)を計算するモジュール
+import tempfile
+from collections import OrderedDict # 取り出した順番を覚えておける辞書(LRUの実装に使う)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.braille_cache')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024 # 文書キャッシュの合計サイズの上限[バイト]
+DEFAULT_MAX_LINES = 50000            # 1行ごとのキャッシュの最大行数(ファイルごとの上限はこれを LINE_SHARDS で割った数)
+LINE_SHARDS = 256                    # 1行ごとのキャッシュを分けるファイルの数(行のハッシュの先頭2文字)
+
+STAT_KEYS = ('hits', 'misses', 'line_hits', 'line_misses', 'evictions')
+
+
+def _write_json_atomic(path, data):
+    """
+    一時ファイルに書き込んでから置き換えることで、書き込み途中のファイルを他のプロセスが読まないようにする。
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _read_json(path, default):
+    """
+    JSONファイルを読み込む。存在しない・壊れている場合は default を返す。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class BrailleCache:
+    """
+    サイズ上限付きのLRU(最後に使われたのが古いものから削除する)ディスクキャッシュ。
+    文書単位のキャッシュと、その下の1行単位のキャッシュの2段構成。
+    """
+
+    def __init__(self, version, cache_dir=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_MAX_BYTES, max_lines=DEFAULT_MAX_LINES):
+        self.version = version # 変換器・点字表のバージョン(キーに含める)
+        self.cache_dir = cache_dir
+        self.docs_dir = os.path.join(cache_dir, 'docs')
+        self.lines_dir = os.path.join(cache_dir, 'lines')
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.max_shard_lines = max(max_lines // LINE_SHARDS, 1)
+        os.makedirs(self.docs_dir, exist_ok=True)
+
+        self.stats = dict.fromkeys(STAT_KEYS, 0) # このプロセスでのヒット/ミス数
+        # 1行単位のキャッシュ。ファイルの名前 → OrderedDict で、使うときに初めて読み込む
+        self._shards = {}
+        self._dirty_shards = set()
+
+    # --------------------------------------------------------
+    # 文書単位のキャッシュ
+    # --------------------------------------------------------
+    def key(self, clean_text):
+        """
+        クリーンアップ後の文字列とバージョンから、キャッシュのキー(SHA-256の16進文字列)を作る。
+        """
+        h = hashlib.sha256(self.version.encode('utf-8'))
+        h.update(b'\0')
+        h.update(clean_text.encode('utf-8'))
+        return h.hexdigest()
+
+    def _doc_path(self, key):
+        return os.path.join(self.docs_dir, key + '.json')
+
+    def get(self, key):
+        """
+        キーに対応する (ひらがな, 点字セルのbytes) を返す。なければ None。
+        """
+        path = self._doc_path(key)
+        entry = _read_json(path, None)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        try:
+            os.utime(path) # 更新日時を「最後に使った日時」として使う(LRU)
+        except OSError:
+            pass
+        self.stats['hits'] += 1
+        return entry['hiragana'], bytes.fromhex(entry['cells'])
+
+    def put(self, key, hiragana, cells):
+        """
+        変換結果を保存し、合計サイズが上限を超えていれば古いものから削除する。
+        """
+        _write_json_atomic(self._doc_path(key), {'hiragana': hiragana, 'cells': cells.hex()})
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.docs_dir):
+            path = os.path.join(self.docs_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue # 他のプロセスが先に削除した
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort() # 最後に使った日時が古い順
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.stats['evictions'] += 1
+            except OSError:
+                pass
+            total -= size
+
+    # --------------------------------------------------------
+    # 1行単位のキャッシュ
+    # --------------------------------------------------------
+    def _shard_path(self, name):
+        return os.path.join(self.lines_dir, name + '.json')
+
+    def _shard(self, line):
+        """
+        行が入るファイルの名前と、その中身(OrderedDict)を返す。初めて使うファイルはここで読み込む。
+        バージョンが変わっていたら中身は使わない。
+        """
+        name = hashlib.sha256(line.encode('utf-8')).hexdigest()[:2]
+        lines = self._shards.get(name)
+        if lines is None:
+            saved = _read_json(self._shard_path(name), {})
+            lines = OrderedDict(saved.get('lines', []) if saved.get('version') == self.version else [])
+            self._shards[name] = lines
+        return name, lines
+
+    def convert_line(self, line, convert):
+        """
+        1行分のひらがな変換結果を返す。キャッシュになければ convert(line) で変換して保存する。
+        """
+        name, lines = self._shard(line)
+        result = lines.get(line)
+        if result is not None:
+            lines.move_to_end(line)
+            self.stats['line_hits'] += 1
+            return result
+        self.stats['line_misses'] += 1
+        result = convert(line)
+        lines[line] = result
+        if len(lines) > self.max_shard_lines:
+            lines.popitem(last=False) # 最後に使ったのが最も古い行を削除
+        self._dirty_shards.add(name)
+        return result
+
+    # --------------------------------------------------------
+    # 保存・統計・削除
+    # --------------------------------------------------------
+    def close(self):
+        """
+        1行単位のキャッシュ(新しい行を加えたファイルだけ)と、このプロセスでのヒット/ミス数(累計に加算)を保存する。
+        """
+        if self._dirty_shards:
+            os.makedirs(self.lines_dir, exist_ok=True)
+            for name in sorted(self._dirty_shards):
+                _write_json_atomic(self._shard_path(name),
+                                   {'version': self.version, 'lines': list(self._shards[name].items())})
+            self._dirty_shards.clear()
+        stats_path = os.path.join(self.cache_dir, 'stats.json')
+        total = _read_json(stats_path, {})
+        for k in STAT_KEYS:
+            total[k] = total.get(k, 0) + self.stats[k]
+        _write_json_atomic(stats_path, total)
+        self.stats = dict.fromkeys(STAT_KEYS, 0)
+
+    def total_stats(self):
+        """
+        保存済みの累計と、このプロセスでまだ保存していない分を合わせた統計を返す。
+        """
+        total = _read_json(os.path.join(self.cache_dir, 'stats.json'), {})
+        stats = {k: total.get(k, 0) + self.stats[k] for k in STAT_KEYS}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['documents'] = len(os.listdir(self.docs_dir))
+        stats['lines'] = sum(len(self._shard_lines(name[:-len('.json')]))
+                             for name in (os.listdir(self.lines_dir) if os.path.isdir(self.lines_dir) else []))
+        return stats
+
+    def _shard_lines(self, name):
+        """
+        ファイル1つ分の行(読み込み済みならその中身、まだならファイルの内容)を返す。統計用。
+        """
+        if name in self._shards:
+            return self._shards[name]
+        saved = _read_json(self._shard_path(name), {})
+        return saved.get('lines', []) if saved.get('version') == self.version else []
+
+    def clear(self):
+        """
+        キャッシュの内容と統計をすべて削除する。
+        """
+        for directory in (self.docs_dir, self.lines_dir):
+            for name in os.listdir(directory) if os.path.isdir(directory) else []:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        for name in ('lines.json', 'stats.json'): # lines.json は1つのファイルに全行を保存していたころのもの
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+        self._shards.clear()
+        self._dirty_shards.clear()
+        self.stats = dict.fromkeys(STAT_KEYS, 0)
@@ -0,0 +1,420 @@
+# 同じページを撮影し直したときに、変わった点字セルだけをESP32へ送るための差分更新。
+# これまでは毎回すべてのセルを '0'/'1' の文字列で送り直しており、9600bpsでは時間がかかるうえ、
+# ESP32側で receivedBrailleData を丸ごと置き換えて currentStartIndex を0に戻すため、読んでいた位置がわからなくなっていた。
+#
+# 送信側(PC2)は端末ごとに最後に送ったセル列を覚えておき、新しいセル列との差分(挿入・削除・置換)を
+# 1行のメッセージにして送る。差分の方が長くなる場合は、全体を送り直すメッセージにする。
+# ESP32からPC2へ返す経路はないため、ESP32が再起動したり1行を取りこぼしたりすると、以降の差分はすべて
+# 送信前のセル数が合わずに捨てられる。そこで差分を RESYNC_EVERY 回送るか、最後に全体を送ってから
+# RESYNC_INTERVAL 秒たったら、次は(ページが変わっていなくても)全体を送り直して表示を合わせ直す。
+#
+# メッセージの形式(1行, 改行で終わる。すべてASCII文字):
+#   E<送信前のセル数>|<操作>|<操作>...   差分更新。操作は位置の大きい順に並び、位置は送信前のセル列での番号(0始まり)
+#       R<位置>:<セル>                    位置からセルを置き換える(セルの数だけ)
+#       I<位置>:<セル>                    位置の前にセルを挿入する
+#       D<位置>,<個数>                    位置から個数分のセルを削除する
+#   F<セル>                              全体の置き換え(読んでいる位置はなるべく保つ)
+#   0/1の文字列(6の倍数の長さ)           従来の形式。全体の置き換えで、読んでいる位置は先頭に戻る
+# <セル> は1セル1文字で、'0'(0x30) + 6bitマスク の文字('0'〜'o')を並べたもの(md_to_binary.py のパック表現と同じマスク)。
+#
+# ESP32側の処理は ESP32_Jan9/ESP32_Jan9.ino の applyDeltaMessage()。
+# このファイルの DeviceSimulator は同じ処理をPythonで再現したもので、実機なしで形式を確認できる。
+#
+# 使用法:
+#   python conversion/braille_delta.py old.md new.md   # 2つのOCR結果の差分メッセージを作り、シミュレータで確認する
+
+import sys
+import time
+import difflib # 2つの列の差分(一致しない区間)を求める標準モジュール
+import argparse
+
+from md_to_binary import CELL_TO_SIGNAL, SIGNAL_TO_CELL, unicode_to_cells, print_debug_info
+
+CELL_CHAR_BASE = 0x30 # セルを1文字で表すときの基準の文字コード('0')
+OP_SEPARATOR = '|'    # 操作の区切り(セルを表す文字 '0'〜'o' には含まれない)
+PINS_PER_CHAR = 6     # ESP32_Jan9.ino と同じ値
+NUM_CHARS = 2         # ESP32_Jan9.ino と同じ値(ボタン1回で進む・戻るセル数)
+RESYNC_EVERY = 10     # 差分をこの回数送ったら、次は全体を送り直す
+RESYNC_INTERVAL = 60.0 # 最後に全体を送ってからこの秒数がたったら、次は全体を送り直す
+
+
+# ----------------------------------------------------
+# セル列 ⇔ 文字列
+# ----------------------------------------------------
+def cells_to_wire(cells):
+    """
+    点字セルのパック表現(bytes)を、1セル1文字のメッセージ用の文字列にする。
+    """
+    return bytes(CELL_CHAR_BASE + c for c in cells).decode('ascii')
+
+
+def wire_to_cells(text):
+    """
+    cells_to_wire() の逆変換。範囲外の文字があれば ValueError を送出する。
+    """
+    cells = bytes(ord(ch) - CELL_CHAR_BASE for ch in text) if text.isascii() else None
+    if cells is None or any(c > 63 for c in cells):
+        raise ValueError(f"セルを表す文字ではありません: {text!r}")
+    return cells
+
+
+def document_to_cells(data, output_format='ascii'):
+    """
+    md_to_binary.py の出力(bytes, --format の形式)をパック表現(bytes)に戻す。
+    形式に合わないデータなら ValueError を送出する。
+    """
+    if output_format == 'packed':
+        if any(c > 63 for c in data):
+            raise ValueError("6点点字のマスク(0〜63)以外のバイトが含まれています。")
+        return bytes(data)
+    if output_format == 'unicode-braille':
+        return unicode_to_cells(data.decode('utf-8').strip())
+    if output_format == 'ascii':
+        text = data.decode('ascii').strip()
+        if len(text) % PINS_PER_CHAR or not set(text) <= {'0', '1'}:
+            raise ValueError("'0'/'1' の6文字ずつの文字列ではありません。")
+        return bytes(SIGNAL_TO_CELL[text[i:i + PINS_PER_CHAR]] for i in range(0, len(text), PINS_PER_CHAR))
+    raise ValueError(f"未対応の出力形式です: {output_format}")
+
+
+# ----------------------------------------------------
+# 差分の計算とメッセージの作成
+# ----------------------------------------------------
+def diff_cells(old, new):
+    """
+    2つのセル列(bytes)の差分を、操作のリストで返す。
+    操作は ('R', 位置, セル) / ('I', 位置, セル) / ('D', 位置, 個数) で、位置の大きい順に並ぶ。
+    位置はすべて old での番号なので、前から順に適用しても他の操作の位置がずれない。
+    """
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        common = min(i2 - i1, j2 - j1) # 置き換えで済む部分
+        if common:
+            ops.append(('R', i1, bytes(new[j1:j1 + common])))
+        if i2 - i1 > common:
+            ops.append(('D', i1 + common, i2 - i1 - common))
+        elif j2 - j1 > common:
+            ops.append(('I', i1 + common, bytes(new[j1 + common:j2])))
+    ops.sort(key=lambda op: op[1], reverse=True)
+    return ops
+
+
+def format_delta(base_len, ops):
+    """
+    差分更新メッセージ(改行なし)を作る。
+    """
+    parts = [f"E{base_len}"]
+    for kind, pos, arg in ops:
+        if kind == 'D':
+            parts.append(f"D{pos},{arg}")
+        else:
+            parts.append(f"{kind}{pos}:{cells_to_wire(arg)}")
+    return OP_SEPARATOR.join(parts)
+
+
+def format_full(cells):
+    """
+    全体を置き換えるメッセージ(改行なし)を作る。
+    """
+    return 'F' + cells_to_wire(cells)
+
+
+def parse_message(line):
+    """
+    メッセージ1行を解析して ('E', 送信前のセル数, 操作のリスト) / ('F', セル) / ('legacy', セル) を返す。
+    形式が正しくない場合は ValueError を送出する。
+    """
+    line = line.strip()
+    if not line:
+        raise ValueError("空のメッセージです。")
+    kind = line[0]
+    if kind == 'F':
+        return 'F', wire_to_cells(line[1:])
+    if kind == 'E':
+        fields = line[1:].split(OP_SEPARATOR)
+        base_len = int(fields[0])
+        ops = []
+        for field in fields[1:]:
+            op = field[:1]
+            if op == 'D':
+                pos, count = field[1:].split(',')
+                ops.append(('D', int(pos), int(count)))
+            elif op in ('R', 'I'):
+                pos, cells = field[1:].split(':', 1)
+                ops.append((op, int(pos), wire_to_cells(cells)))
+            else:
+                raise ValueError(f"不明な操作です: {field!r}")
+        return 'E', base_len, ops
+    if set(line) <= {'0', '1'} and len(line) % PINS_PER_CHAR == 0:
+        signals = [line[i:i + PINS_PER_CHAR] for i in range(0, len(line), PINS_PER_CHAR)]
+        return 'legacy', bytes(SIGNAL_TO_CELL[s] for s in signals)
+    raise ValueError(f"不明なメッセージです: {line[:20]!r}")
+
+
+def apply_ops(cells, ops):
+    """
+    差分の操作をセル列に適用した結果を返す(参照実装)。
+    操作は diff_cells() と同じく位置の大きい順に並んでいる必要がある。位置が範囲外なら ValueError。
+    """
+    cells = bytearray(cells)
+    for kind, pos, arg in ops:
+        if pos < 0:
+            raise ValueError(f"位置が負の値です: {kind}{pos}")
+        if kind == 'R':
+            if pos + len(arg) > len(cells):
+                raise ValueError(f"置き換える範囲がセル列の外です: R{pos}")
+            cells[pos:pos + len(arg)] = arg
+        elif kind == 'I':
+            if pos > len(cells):
+                raise ValueError(f"挿入する位置がセル列の外です: I{pos}")
+            cells[pos:pos] = arg
+        elif kind == 'D':
+            if arg <= 0 or pos + arg > len(cells):
+                raise ValueError(f"削除する範囲がセル列の外です: D{pos},{arg}")
+            del cells[pos:pos + arg]
+    return bytes(cells)
+
+
+class DeltaEncoder:
+    """
+    端末ごとに最後に送ったセル列を覚えておき、新しいセル列を送るためのメッセージを作る。
+    差分更新メッセージが全体の置き換えより長くなる場合は、全体の置き換えを返す。
+    resync_every 回差分を送るか、最後に全体を送ってから resync_interval 秒たつと、次は全体を送り直す
+    (None でそれぞれ無効)。ESP32が差分を受け取れずに古い表示のままになっても、そこで元に戻る。
+    """
+
+    def __init__(self, resync_every=RESYNC_EVERY, resync_interval=RESYNC_INTERVAL):
+        self.resync_every = resync_every
+        self.resync_interval = resync_interval
+        self.last_sent = {}  # 端末ID → 最後に送ったセル列(bytes)
+        self.deltas = {}     # 端末ID → 最後に全体を送ってから送った差分の数
+        self.full_sent_at = {} # 端末ID → 最後に全体を送った時刻(time.monotonic())
+
+    def update(self, device_id, cells):
+        """
+        新しいセル列を送るためのメッセージ(改行なし)を返し、送ったものとして記録する。
+        前回と同じで全体を送り直す時期でもなければ None を返す(送る必要がない)。
+        """
+        cells = bytes(cells)
+        old = self.last_sent.get(device_id)
+        self.last_sent[device_id] = cells
+        resync = self._resync_due(device_id)
+        if old == cells and not resync:
+            return None
+        full = format_full(cells)
+        if old is not None and not resync:
+            delta = format_delta(len(old), diff_cells(old, cells))
+            if len(delta) < len(full):
+                self.deltas[device_id] = self.deltas.get(device_id, 0) + 1
+                return delta
+        self.deltas[device_id] = 0
+        self.full_sent_at[device_id] = time.monotonic()
+        return full
+
+    def _resync_due(self, device_id):
+        """
+        最後に全体を送ってから差分を送っていて、その回数か経過時間が上限に達していれば True。
+        """
+        deltas = self.deltas.get(device_id, 0)
+        if not deltas:
+            return False
+        if self.resync_every is not None and deltas >= self.resync_every:
+            return True
+        elapsed = time.monotonic() - self.full_sent_at.get(device_id, 0.0)
+        return self.resync_interval is not None and elapsed >= self.resync_interval
+
+    def forget(self, device_id):
+        """
+        端末の記録を消す(再接続・再起動した端末には次回は全体を送る)。
+        """
+        self.last_sent.pop(device_id, None)
+        self.deltas.pop(device_id, None)
+        self.full_sent_at.pop(device_id, None)
+
+
+# ----------------------------------------------------
+# ESP32のシミュレータ
+# ----------------------------------------------------
+class DeviceSimulator:
+    """
+    ESP32_Jan9.ino の受信・ボタン・表示の処理を再現する。
+    received_braille_data と current_start_index は、スケッチの receivedBrailleData と currentStartIndex に対応する。
+    """
+
+    def __init__(self):
+        self.received_braille_data = '' # '0'/'1' の文字列(6文字で1セル)
+        self.current_start_index = 0
+        self.log = [] # スケッチがシリアルモニタに出すステータス
+
+    def reset(self):
+        """
+        ESP32の再起動を再現する(受信したデータと読んでいた位置が消える)。
+        """
+        self.received_braille_data = ''
+        self.current_start_index = 0
+        self.log.append(">> Status: RESET")
+
+    @property
+    def total_chars(self):
+        return len(self.received_braille_data) // PINS_PER_CHAR
+
+    def cells(self):
+        data = self.received_braille_data
+        return bytes(SIGNAL_TO_CELL[data[i:i + PINS_PER_CHAR]] for i in range(0, len(data), PINS_PER_CHAR))
+
+    def receive_line(self, line):
+        """
+        シリアルから1行受信したときの処理。受け付けたら True を返す。
+        """
+        line = line.strip()
+        try:
+            message = parse_message(line)
+        except ValueError:
+            status = {'E': "Invalid Delta", 'F': "Invalid Cells"}.get(line[:1], "Invalid Data Length")
+            self.log.append(f">> Status: ERROR ({status})")
+            return False
+
+        if message[0] == 'legacy':
+            self.received_braille_data = line
+            self.current_start_index = 0
+            self.log.append(">> Status: NEW DATA STORED")
+            return True
+
+        if message[0] == 'F':
+            self._store(message[1], self.current_start_index)
+            self.log.append(">> Status: FULL UPDATE")
+            return True
+
+        _, base_len, ops = message
+        try:
+            if base_len != self.total_chars:
+                # 前回のデータを受け取れていない(再起動など)ので、適用せずに全体の再送を待つ
+                raise ValueError("送信前のセル数が一致しません。")
+            cells = apply_ops(self.cells(), ops)
+        except ValueError:
+            self.log.append(">> Status: ERROR (Invalid Delta)")
+            return False
+        self._store(cells, self._shift_index(self.current_start_index, ops))
+        self.log.append(">> Status: DELTA APPLIED")
+        return True
+
+    @staticmethod
+    def _shift_index(index, ops):
+        """
+        読んでいる位置より前でセルが挿入・削除されたら、同じ内容を読み続けられるように位置をずらす。
+        """
+        for kind, pos, arg in ops:
+            if kind == 'I' and pos < index:
+                index += len(arg)
+            elif kind == 'D':
+                if pos + arg <= index:
+                    index -= arg
+                elif pos < index:
+                    index = pos # 読んでいたセルが削除された
+        return index
+
+    def _store(self, cells, index):
+        self.received_braille_data = ''.join(CELL_TO_SIGNAL[c] for c in cells)
+        # ボタンは NUM_CHARS 単位で進むので、位置もその倍数にそろえて範囲内に収める
+        index = min(index, max(self.total_chars - 1, 0))
+        self.current_start_index = index - index % NUM_CHARS
+
+    def press_next(self):
+        if self.current_start_index + NUM_CHARS < self.total_chars:
+            self.current_start_index += NUM_CHARS
+
+    def press_prev(self):
+        if self.current_start_index > 0:
+            self.current_start_index -= NUM_CHARS
+
+    def display(self):
+        """
+        表示中の点字(6桁の文字列)を返す。データがなければ None(全下げ)。
+        """
+        start = self.current_start_index * PINS_PER_CHAR
+        if len(self.received_braille_data) >= PINS_PER_CHAR and start + PINS_PER_CHAR <= len(self.received_braille_data):
+            return self.received_braille_data[start:start + PINS_PER_CHAR]
+        return None
+
+
+def simulate_resync(old_cells, new_cells, fault, resync_every=RESYNC_EVERY):
+    """
+    old_cells の後に new_cells を送ったところで、ESP32が再起動する(fault='reset')か、その差分を取りこぼした
+    (fault='drop')とする。その後も撮影し直すたびに末尾の1セルだけ変わるページを送り続けたときに、
+    何回目の送信以降、表示が送ったセル列と一致し続けるかを返す。戻らなければ None。
+    """
+    encoder = DeltaEncoder(resync_every=resync_every, resync_interval=None)
+    device = DeviceSimulator()
+    device.receive_line(encoder.update('device', old_cells))
+    message = encoder.update('device', new_cells)
+    if fault == 'reset':
+        device.receive_line(message)
+        device.reset()
+    in_sync_since = None
+    for count in range(1, 2 * resync_every + 2):
+        cells = bytes(new_cells) + bytes([count % 63 + 1])
+        message = encoder.update('device', cells)
+        if message is not None:
+            device.receive_line(message)
+        if device.cells() != cells:
+            in_sync_since = None
+        elif in_sync_since is None:
+            in_sync_since = count
+    return in_sync_since
+
+
+# --------------------------------------------------------
+# メイン実行ブロック
+# --------------------------------------------------------
+if __name__ == '__main__':
+    from md_to_binary import read_markdown_file, clean_markdown_text, to_hiragana, to_braille_cells
+
+    parser = argparse.ArgumentParser(description="2つのOCR結果の差分更新メッセージを作り、ESP32のシミュレータで確認する")
+    parser.add_argument('old_md', help="前回送信したMarkdownファイル")
+    parser.add_argument('new_md', help="撮影し直したMarkdownファイル")
+    args = parser.parse_args()
+
+    cells = []
+    for path in (args.old_md, args.new_md):
+        md_content = read_markdown_file(path)
+        if md_content is None:
+            print(f"エラー: ファイルを読み込めません: {path}", file=sys.stderr)
+            sys.exit(1)
+        cells.append(to_braille_cells(to_hiragana(clean_markdown_text(md_content))))
+    old_cells, new_cells = cells
+
+    encoder = DeltaEncoder()
+    device = DeviceSimulator()
+    device.receive_line(encoder.update('device', old_cells))
+    device.current_start_index = (len(old_cells) // 2) & ~1 # 途中まで読んでいたことにする
+    reading = device.display()
+    message = encoder.update('device', new_cells)
+
+    if message is None:
+        print_debug_info("差分", "変更はありません。")
+        sys.exit(0)
+    print(message)
+    device.receive_line(message)
+
+    legacy_bytes = len(new_cells) * PINS_PER_CHAR + 1 # 従来の形式('0'/'1'の文字列 + 改行)
+    print_debug_info("送信バイト数",
+                     f"差分メッセージ: {len(message) + 1} / 従来の全体送信: {legacy_bytes}\n"
+                     f"種類: {'差分更新' if message.startswith('E') else '全体の置き換え'}")
+    print_debug_info("シミュレータ",
+                     f"{device.log[-1]}\n"
+                     f"結果が新しいセル列と一致: {device.cells() == new_cells}\n"
+                     f"読んでいた位置: {len(old_cells) // 2 & ~1} → {device.current_start_index} "
+                     f"(表示: {reading} → {device.display()})")
+    if device.cells() != new_cells:
+        sys.exit(1)
+
+    # ESP32の再起動・1行の取りこぼしから、全体の送り直しで表示が元に戻るか確認する
+    recovered = {fault: simulate_resync(old_cells, new_cells, fault) for fault in ('reset', 'drop')}
+    print_debug_info("再同期",
+                     '\n'.join(f"{fault}: {'戻らない' if count is None else f'{count}回目の送信から元に戻った'}"
+                                for fault, count in recovered.items()))
+    if None in recovered.values():
+        sys.exit(1)
@@ -0,0 +1,82 @@
+# 変換サーバー(conversion_server.py)に.mdファイルの変換を依頼する薄いクライアント。
+# 標準出力・標準エラー出力の内容は md_to_binary.py と同じなので、
+# 既存のスクリプトやProcessingスケッチからはコマンドを置き換えるだけで使える。
+#
+# 使用法:
+#   python conversion/conversion_client.py results/PBL_imgproc2_test1_p1.md
+# サーバーが起動していない場合や、サーバーで変換できなかった場合は、このプロセス内で変換する(md_to_binary.pyと同じ動作)。
+
+import sys
+import socket
+import argparse
+
+from conversion_protocol import (DEFAULT_HOST, DEFAULT_PORT, STATUS_OK, OUTPUT_FORMATS,
+                                 send_request, recv_response)
+
+CONNECT_TIMEOUT = 1.0 # サーバーへの接続待ち時間[秒]
+
+
+class ConversionError(Exception):
+    """
+    変換サーバーがエラーを返した(変換に失敗した)ことを表す例外。メッセージはサーバーのエラーメッセージ。
+    """
+
+
+def convert_via_server(md_content, host=DEFAULT_HOST, port=DEFAULT_PORT, output_format='ascii'):
+    """
+    変換サーバーにMarkdown文字列を送り、指定した出力形式の点字信号(bytes)を受け取って返す。
+    サーバーに接続できない場合は OSError を、サーバーがエラーを返した場合は ConversionError を送出する。
+    """
+    with socket.create_connection((host, port), timeout=CONNECT_TIMEOUT) as sock:
+        sock.settimeout(None) # 接続後は変換が終わるまで待つ
+        send_request(sock, md_content, output_format)
+        status, body = recv_response(sock)
+    if status != STATUS_OK:
+        raise ConversionError(body.decode('utf-8', errors='replace'))
+    return body
+
+
+# --------------------------------------------------------
+# メイン実行ブロック (標準出力にバイナリ文字列を出力)
+# --------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="点字信号変換クライアント")
+    parser.add_argument('md_file_path', help="処理対象のMarkdownファイルパス")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='ascii', help="出力形式")
+    args = parser.parse_args()
+
+    try:
+        with open(args.md_file_path, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+    except Exception:
+        sys.exit(1)
+
+    try:
+        output_data = convert_via_server(md_content, args.host, args.port, args.format)
+    except (OSError, ConversionError) as e:
+        # サーバーが起動していなければ、従来どおりこのプロセス内で変換する。
+        # サーバーが変換に失敗した場合(古いバージョンのサーバーなど)も、エラーを表示してからこのプロセス内で変換する
+        if isinstance(e, ConversionError):
+            print(f"\n--- 変換サーバーのエラー ---\n{e}\n(このプロセス内で変換します)", file=sys.stderr)
+        from md_to_binary import markdown_to_signals, encode_signals
+        output_data = encode_signals(markdown_to_signals(md_content), args.format)
+
+    # 標準出力への書き出し方は md_to_binary.py の write_output() と同じ
+    if args.format == 'ascii':
+        print(output_data.decode('ascii'))
+    else:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(output_data if args.format == 'packed' else output_data + b'\n')
+        sys.stdout.buffer.flush()
+
+    # デバッグ情報は md_to_binary.py と同じ形式で標準エラー出力に出す
+    if args.format == 'ascii':
+        num_cells = len(output_data) // 6
+    elif args.format == 'packed':
+        num_cells = len(output_data)
+    else:
+        num_cells = len(output_data.decode('utf-8'))
+    print("\n--- バイナリ信号総数 ---", file=sys.stderr)
+    print(num_cells * 6, file=sys.stderr)
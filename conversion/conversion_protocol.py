@@ -0,0 +1,55 @@
+# 変換サーバー(conversion_server.py)と変換クライアント(conversion_client.py)の間の通信フォーマット。
+# クライアントがpykakasiを読み込まずに済むよう、サーバー本体とは別のファイルにしている。
+
+import json # リクエストの中身(JSON)を扱うモジュール
+import struct # 長さヘッダ(4バイト)のパック/アンパック用モジュール
+
+# --------------------------------------------------------
+# 通信設定
+# --------------------------------------------------------
+DEFAULT_HOST = '127.0.0.1' # 同じPC(PC2)内からのみ接続を受け付ける
+DEFAULT_PORT = 50007
+
+STATUS_OK = 0    # 変換成功
+STATUS_ERROR = 1 # 変換失敗(ペイロードはエラーメッセージ)
+
+# 出力形式(md_to_binary.py の --format)。クライアントもpykakasiを読み込まずに参照できるよう、ここで定義する
+OUTPUT_FORMATS = ('ascii', 'packed', 'unicode-braille')
+
+# 通信フォーマット(すべてビッグエンディアン)
+# リクエスト: [本文の長さ 4バイト][本文(UTF-8のJSON) {"markdown": "...", "format": "ascii"}]
+# formatは OUTPUT_FORMATS のいずれか(md_to_binary.py の --format と同じ)。省略時はascii。
+# レスポンス: [ステータス 1バイト][本文の長さ 4バイト][本文]
+LENGTH_HEADER = struct.Struct('>I')
+RESPONSE_HEADER = struct.Struct('>BI')
+
+
+def recv_exact(sock, size):
+    """
+    ソケットからちょうどsizeバイトを受信して返す。途中で切断された場合は ConnectionError を送出する。
+    """
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("受信中に接続が切断されました。")
+        received += n
+    return bytes(buf)
+
+
+def send_request(sock, md_content, output_format='ascii'):
+    """
+    Markdown文字列を変換リクエストとして送信する。
+    """
+    body = json.dumps({'markdown': md_content, 'format': output_format}, ensure_ascii=False).encode('utf-8')
+    sock.sendall(LENGTH_HEADER.pack(len(body)) + body)
+
+
+def recv_response(sock):
+    """
+    レスポンスを受信し、(ステータス, 本文のバイト列) を返す。
+    """
+    status, length = RESPONSE_HEADER.unpack(recv_exact(sock, RESPONSE_HEADER.size))
+    return status, recv_exact(sock, length)
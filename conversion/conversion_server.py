@@ -0,0 +1,94 @@
+# 点字信号変換を常駐プロセスで行うための変換サーバー。
+# md_to_binary.py をページごとに起動すると、毎回Pythonの起動とpykakasiの辞書読み込みが
+# 発生し、1ページ分の変換そのものより時間がかかる。
+# このサーバーは起動時に一度だけkakasiのコンバータを生成し、以降はソケット経由で
+# Markdownを受け取って点字信号を返す。
+#
+# 使用法:
+#   python conversion/conversion_server.py [--host 127.0.0.1] [--port 50007]
+# クライアントは conversion/conversion_client.py を使う。
+
+import sys
+import json # リクエストの中身(JSON)を扱うモジュール
+import argparse # コマンドライン引数を解析するモジュール
+import threading
+import socketserver # TCPサーバーを簡単に作るための標準モジュール
+
+from md_to_binary import get_hiragana_converter, markdown_to_signals, encode_signals, print_debug_info
+from conversion_protocol import (DEFAULT_HOST, DEFAULT_PORT, STATUS_OK, STATUS_ERROR,
+                                 LENGTH_HEADER, RESPONSE_HEADER, recv_exact)
+
+
+class ConversionHandler(socketserver.BaseRequestHandler):
+    """
+    1つの接続を担当するハンドラ。接続が切れるまで、リクエストを受け取るたびに変換して返す。
+    """
+
+    def handle(self):
+        while True:
+            try:
+                (length,) = LENGTH_HEADER.unpack(recv_exact(self.request, LENGTH_HEADER.size))
+                payload = recv_exact(self.request, length)
+            except ConnectionError:
+                return # クライアントが接続を閉じた
+
+            try:
+                request = parse_request(payload)
+            except ValueError as e:
+                # 壊れたリクエストでもハンドラを終わらせず、エラーを返して次のリクエストを待つ
+                self.reply(STATUS_ERROR, f"リクエストが不正です: {e}".encode('utf-8'))
+                continue
+
+            try:
+                # コンバータはスレッド間で共有しているため、変換はロックの中で1件ずつ行う
+                with self.server.convert_lock:
+                    signals = markdown_to_signals(request['markdown'])
+                status, body = STATUS_OK, encode_signals(signals, request.get('format', 'ascii'))
+            except Exception as e:
+                status, body = STATUS_ERROR, str(e).encode('utf-8')
+
+            self.reply(status, body)
+
+    def reply(self, status, body):
+        self.request.sendall(RESPONSE_HEADER.pack(status, len(body)) + body)
+
+
+def parse_request(payload):
+    """
+    リクエストの中身(UTF-8のJSON)を辞書にする。UTF-8やJSONとして読めない場合や、
+    文字列の markdown を含まない場合は ValueError を送出する(UnicodeDecodeError・JSONDecodeError も ValueError)。
+    """
+    request = json.loads(payload.decode('utf-8'))
+    if not isinstance(request, dict) or not isinstance(request.get('markdown'), str):
+        raise ValueError("文字列の 'markdown' がありません。")
+    return request
+
+
+class ConversionServer(socketserver.ThreadingTCPServer):
+    """
+    コンバータを1つだけ保持し、複数の接続で使い回す変換サーバー。
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address):
+        super().__init__(server_address, ConversionHandler)
+        self.convert_lock = threading.Lock()
+        get_hiragana_converter().convert("変換") # 起動時に辞書の読み込みとコンバータの生成を済ませ、最初のリクエストから速く応答できるようにしておく
+
+
+# --------------------------------------------------------
+# メイン実行ブロック
+# --------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="点字信号変換サーバー")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    with ConversionServer((args.host, args.port)) as server:
+        print_debug_info("変換サーバー起動", f"{args.host}:{args.port} で待機中 (Ctrl+Cで終了)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            sys.exit(0)
@@ -0,0 +1,169 @@
+# ひらがな変換(to_hiragana)の高速化。
+# OCR結果の多くはすでにひらがな・カタカナ・英数字・記号で、辞書を引く必要があるのは漢字の部分だけである。
+# 以前は文書全体を kakasi の do() に渡していたが、do() は1文字ずつPythonのループで処理するため遅い。
+# ここでは文字列を kakasi が区切るのと同じ位置で分け、
+#   * 漢字・長音記号・半角カナを含む部分 → kakasi で変換(同じ部分の変換結果は覚えておき、使い回す)
+#   * それ以外(ひらがな・全角カタカナ・英数字・記号) → カタカナだけ文字コードを 0x60 ずらす(str.translate)
+# として変換する。結果は kakasi の do() に文書全体を渡した場合と完全に一致する
+# (verify_hiragana.py で確認できる)。
+#
+# 区切ってよい位置(kakasiが前の文字の影響を受けずに変換を始める位置)の条件:
+#   * 長音記号(ー―−ｰ)ではない(長音記号は直前の文字によって「前の文字の繰り返し」「-」などに変わる)
+#   * 前にある漢字の読み(辞書の見出し語)が、その位置まで届かない
+#     (「買い得」「行動データ」のように、かなを含む見出し語もあるため)
+#   * 直前(長音記号を除く)もその位置も全角/半角カタカナ、ではない
+#     (kakasi はカタカナの並びを32文字ずつまとめて変換し、長音記号の扱いがまとめ方で変わるため)
+#   * 直前が半角カナではない
+#     (まとめた32文字の最後が半角カナだと、kakasi は次の1文字も一緒に読み飛ばしてしまうため)
+
+from functools import lru_cache
+import numpy as np
+
+try:
+    # 区切り位置を決めるために、kakasi 自身の文字の分類と漢字辞書を使う
+    from pykakasi.kanji import JConv, Kanwa, Itaiji
+    from pykakasi.scripts import K2
+except ImportError: # 内部構成の違うバージョンでは高速化せず、すべて kakasi で変換する
+    JConv = None
+
+MEMO_SIZE = 4096 # 覚えておく変換結果の数(文書中に何度も出てくる用語の読み)
+# 生成時に高速化した変換と kakasi の結果を比べる文字列(漢字・かなを含む見出し語・半角カナ・長音記号・カタカナ)
+PROBE_TEXT = '行動データを買い得なｶﾞｰﾃﾞﾝで、ロボットー―日本人々'
+DASH_CHARS = 'ー―−ｰ' # kakasi が長音記号として扱う文字(ー ― − ｰ)
+
+# 全角カタカナ(ァ〜ヶ) → ひらがな(ぁ〜ゖ)。kakasi と同じく、ヷ〜ヺ と 中点(・) はそのまま残す
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+# 1文字ごとの性質(_char_props() が返す配列の列)
+PROP_SLOW = 0      # kakasi で変換する必要がある文字(漢字・長音記号・半角カナなど)
+PROP_DASH = 1      # 長音記号
+PROP_KATAKANA = 2  # kakasi がカタカナとしてまとめて変換する文字
+PROP_REACH = 3     # 漢字の場合、その文字から始まる見出し語の最大文字数(漢字以外は0)
+PROP_VARIATION = 4 # 異体字セレクタ(kakasi は前の漢字と合わせて文字数を数え直すため、文書全体を kakasi に渡す)
+PROP_HALFWIDTH = 5 # 半角カナ
+
+
+class HiraganaConverter:
+    """
+    kakasi のコンバータ(get_converter() の戻り値)と同じ結果を返す、ひらがな変換。
+    convert(text) は converter.do(text) と同じ文字列を返す。
+    """
+
+    def __init__(self, converter, memo_size=MEMO_SIZE):
+        self.converter = converter
+        self._props = {} # 文字コード → 性質(PROP_* の順のタプル)
+        # 漢字を含む部分の変換結果を memo_size 件まで覚えておく(古いものから忘れる)
+        self.convert_run = lru_cache(maxsize=memo_size)(converter.do)
+        self.fast = self._probe()
+
+    def _probe(self):
+        """
+        高速化に使う pykakasi の内部の機能(JConv, Kanwa, Itaiji, K2)がこのバージョンでも使えるかを1回だけ確かめる。
+        どれかがない・呼び出し方が違う・結果が kakasi と異なる場合は False を返し、以後はすべて kakasi で変換する
+        (属性がないことによる AttributeError を、呼び出し側のフォールバック処理に渡さないため)。
+        """
+        if JConv is None:
+            return False
+        try:
+            self._jconv = JConv()
+            self._kanwa = Kanwa()
+            self._itaiji = Itaiji()
+            if self._convert_fast(PROBE_TEXT) == self.converter.do(PROBE_TEXT):
+                return True
+        except Exception: # 内部の機能はバージョンによって変わるため、どの例外でも高速化をやめる
+            pass
+        self._props.clear()
+        self.convert_run.cache_clear()
+        return False
+
+    def memo_info(self):
+        """
+        変換結果の使い回しの状況(hits, misses, maxsize, currsize)を返す。
+        """
+        return self.convert_run.cache_info()
+
+    def _char_props(self, code):
+        """
+        1文字の性質を PROP_* の順のタプルで返す(文字コードごとに1回だけ調べる)。
+        """
+        props = self._props.get(code)
+        if props is not None:
+            return props
+        char = chr(code)
+        dash = char in DASH_CHARS
+        katakana = K2.isRegion(char)
+        reach = 0
+        variation = False
+        if self._jconv.isRegion(char):
+            base = self._itaiji.convert(char)
+            variation = base == '' # 異体字セレクタは変換後に消える
+            table = self._kanwa.load(base) if base else None
+            reach = max((len(key) for key in table), default=1) if table else 1
+        # 全角カタカナ(長音記号以外)は文字コードの計算で変換できる。半角カナや拡張かなは kakasi に任せる
+        fullwidth_kana = 0x30A0 < code < 0x30FD and not dash
+        slow = dash or reach > 0 or (katakana and not fullwidth_kana) or _is_kana_ext(code)
+        props = (slow, dash, katakana, reach, variation, K2._is_half_width_kana(code))
+        self._props[code] = props
+        return props
+
+    def convert(self, text):
+        """
+        文字列をひらがなに変換する(kakasi の do() と同じ結果)。
+        """
+        if not text:
+            return ''
+        if not self.fast:
+            return self.converter.do(text)
+        return self._convert_fast(text)
+
+    def _convert_fast(self, text):
+        """
+        文字列を kakasi が区切るのと同じ位置で分け、漢字などを含む部分だけを kakasi で変換する。
+        """
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        uniq, inverse = np.unique(codes, return_inverse=True)
+        table = np.array([self._char_props(int(c)) for c in uniq], dtype=np.int64)
+        slow = table[inverse, PROP_SLOW].astype(bool)
+        if not slow.any():
+            return text.translate(KATAKANA_TO_HIRAGANA) # 漢字も長音記号もなければ表引きだけで済む
+        if table[:, PROP_VARIATION].any():
+            return self.converter.do(text)
+
+        n = len(codes)
+        index = np.arange(n)
+        dash = table[inverse, PROP_DASH].astype(bool)
+        katakana = table[inverse, PROP_KATAKANA].astype(bool)
+        reach = table[inverse, PROP_REACH]
+        halfwidth = table[inverse, PROP_HALFWIDTH].astype(bool)
+
+        # 各位置までに出てきた漢字の読みが届く範囲の終わり
+        limit = np.maximum.accumulate(np.where(reach > 0, index + reach, 0))
+        # 各位置の直前(長音記号を除く)の文字がカタカナか
+        last = np.maximum.accumulate(np.where(dash, -1, index))
+        prev_katakana = np.where(last >= 0, katakana[np.maximum(last, 0)], False)
+
+        split = np.ones(n, dtype=bool)
+        split[1:] = (~dash[1:] & (index[1:] >= limit[:-1]) & ~(katakana[1:] & prev_katakana[:-1])
+                     & ~halfwidth[:-1])
+        starts = np.flatnonzero(split)
+        slow_pieces = np.bincount(np.cumsum(split) - 1, weights=slow, minlength=len(starts)) > 0
+        ends = np.append(starts[1:], n)
+
+        out = []
+        pos = 0
+        for k in np.flatnonzero(slow_pieces).tolist():
+            start, end = int(starts[k]), int(ends[k])
+            if pos < start:
+                out.append(text[pos:start].translate(KATAKANA_TO_HIRAGANA))
+            out.append(self.convert_run(text[start:end]))
+            pos = end
+        if pos < n:
+            out.append(text[pos:].translate(KATAKANA_TO_HIRAGANA))
+        return ''.join(out)
+
+
+def _is_kana_ext(code):
+    """
+    kakasi がひらがな・カタカナとして扱う、BMP外のかな(U+1B150〜)か。
+    """
+    return 0x1B150 <= code <= 0x1B152 or 0x1B164 <= code <= 0x1B167
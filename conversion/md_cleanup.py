@@ -0,0 +1,159 @@
+# md_to_binary.py と md_to_hiragana.py で共通に使うMarkdownクリーンアップ。
+# 以前はそれぞれのファイルで re.sub() を5回・7回続けて呼んでいたため、置換のたびに文書全体を
+# 走査・コピーしており、2つのファイルで除去する記号も食い違っていた(リスト記号の扱い)。
+# ここでは、HTMLタグ・リンク/画像・見出し・リスト記号・強調/コードを1つにまとめた正規表現で
+# 文書(ストリーミング時は1行)を1回だけ走査し、そのあと空行を除く。
+#
+# 見出し・リスト記号は、以前の実装(clean_markdown_text_regex)では空白に改行も含む \s で表していたため、
+# 「- 1. 項目」の両方の記号や、空白だけの行をまたいだ記号もまとめて取り除かれる。
+# この結果と一致させるため、行頭から続く記号・空白・タグ・リンクだけの部分(行頭部分)を1つの単位として取り出し、
+# その部分にだけ以前と同じ置換(_LEGACY_STEPS)を行う。行頭部分は「# 」「- 」「1. 」などの決まった形が
+# ほとんどなので、置換結果は覚えておいて使い回す。
+# 結果が以前の実装と一致することは verify_md_cleanup.py で確認できる。
+#
+# 文字列全体を処理する clean_markdown_text() と、1行ずつ返す iter_clean_markdown_lines() がある。
+
+import re
+from functools import lru_cache
+
+# 以前の実装の置換(タグ → リンク → 見出し → リスト記号 → 番号 → 強調/コード の順)。
+# 3つ目の要素は、その置換が一致するために必ず含まれる文字(含まれなければ置換を省略できる)
+_LEGACY_STEPS = (
+    (re.compile(r'<[^>]*>'), '', '<'),
+    (re.compile(r'\[(.*?)\]\(.*?\)'), r'\1', '['),
+    (re.compile(r'^\s*#+\s*', re.MULTILINE), '', '#'),
+    (re.compile(r'^\s*[-*+]\s+', re.MULTILINE), '', '-*+'),
+    (re.compile(r'^\s*\d+\.\s+', re.MULTILINE), '', '.'),
+    (re.compile(r'[*_`]'), '', '*_`'),
+)
+
+_TAG = r'<[^>]*>'                     # HTMLタグ
+_LINK = r'\[(?P<link>.*?)\]\(.*?\)'   # リンク/画像 ([text](url)) → text
+_EMPHASIS = r'[*_`]'                  # 強調・コード
+# 行頭部分: 行頭から続く、空白(改行を含む)・見出し/リスト/番号の記号・タグ・リンクの並び。
+# 空白と数字だけの部分(空行など)は置換しても変わらないので、記号・タグ・リンクを含む場合だけ一致させる
+_PREFIX = r'^(?=[\s\d]*[#*+\-.<\[])(?:[\s#*+\-\d.]+|<[^>]*>|\[.*?\]\(.*?\))+'
+_SPACE_TAIL_PATTERN = re.compile(r'[\s\d]*\Z')
+_TAIL_PATTERN = re.compile(r'(?:[\s#*+\-\d.]|\[.*?\]\(.*?\))*\Z') # 文字列の末尾の、行頭部分になりうる文字の並び
+
+# 上の4つを1つにまとめた正規表現。1回の走査で、見つかった位置ごとに置換する
+_SCAN_PATTERN = re.compile(f'(?P<prefix>{_PREFIX})|{_TAG}|{_LINK}|{_EMPHASIS}', re.MULTILINE)
+_INLINE_PATTERN = re.compile(f'{_TAG}|{_EMPHASIS}') # リンクのテキスト部分の中を処理する用
+
+PREFIX_MEMO_SIZE = 1024 # 覚えておく行頭部分の置換結果の数
+
+
+@lru_cache(maxsize=PREFIX_MEMO_SIZE)
+def _clean_prefix(prefix):
+    """
+    行頭部分に、以前の実装と同じ置換を順に行う。
+    """
+    for pattern, replacement, required in _LEGACY_STEPS:
+        if any(char in prefix for char in required):
+            prefix = pattern.sub(replacement, prefix)
+    return prefix
+
+
+def _replace(match):
+    """
+    _SCAN_PATTERN に一致した部分の置換後の文字列を返す。行頭部分は以前と同じ置換を行い、
+    リンクはテキスト部分だけを残す(テキスト中のタグや強調記号も取り除く)。それ以外は削除する。
+    """
+    prefix = match.group('prefix')
+    if prefix is not None:
+        return _clean_prefix(prefix)
+    link_text = match.group('link')
+    if link_text is not None:
+        return _INLINE_PATTERN.sub('', link_text)
+    return ''
+
+
+def clean_markdown_line(line):
+    """
+    1行分(複数行にまたがるHTMLタグを含む場合は複数行分)のMarkdown記号を取り除く。
+    """
+    return _SCAN_PATTERN.sub(_replace, line)
+
+
+def _ends_in_prefix(chunk):
+    """
+    chunk の最後が行頭部分の途中か(次の行の行頭部分と続けて置換する必要があるか)。
+    """
+    if _TAIL_PATTERN.search(chunk).start() > chunk.rfind('>') + 1:
+        return False # 最後のタグより後ろに行頭部分にならない文字がある(ほとんどの行はここで判定できる)
+    last = None
+    for last in _SCAN_PATTERN.finditer(chunk):
+        pass
+    if last is not None and last.group('prefix') is not None and last.end() == len(chunk):
+        return True
+    # 空白と数字だけの行頭部分(_SCAN_PATTERN では一致させない)が、最後の一致より後ろの行頭から末尾まで続くか
+    start = max(_SPACE_TAIL_PATTERN.search(chunk).start(), last.end() if last is not None else 0)
+    return start == 0 or '\n' in chunk[start - 1:-1]
+
+
+def _iter_cleaned_chunks(lines):
+    """
+    行のイテラブルを受け取り、1行ずつクリーンアップした文字列を返すジェネレータ。
+    HTMLタグが複数行にまたがる場合はタグが閉じるまで、行頭部分が次の行に続く場合(空白や記号だけの行など)は
+    行頭部分が終わるまで、まとめて処理する。
+    """
+    buffer = ''
+    for raw_line in lines:
+        buffer += raw_line
+        if buffer.rfind('<') > buffer.rfind('>'):
+            continue # HTMLタグが次の行に続いているので、閉じるまで読み進める
+        if _ends_in_prefix(buffer):
+            continue # 行頭部分が次の行に続く可能性があるので、次の行とまとめて置換する
+        yield clean_markdown_line(buffer)
+        buffer = ''
+    if buffer:
+        yield clean_markdown_line(buffer) # 閉じられなかった '<' や、行頭部分だけで終わる残り
+
+
+def iter_clean_markdown_lines(lines):
+    """
+    Markdownの行(ファイルオブジェクトなど、改行付きの行のイテラブル)を受け取り、
+    クリーンアップした行(改行なし)を順に返すジェネレータ。
+    空行は除去し、文書全体の先頭と末尾の空白も取り除く。返す行を改行で連結すると clean_markdown_text() と同じになる。
+    """
+    pending = None   # まだ返していない直前の行(文書末尾の空白を取り除くために1行だけ保持する)
+    blank_lines = [] # 空白文字だけの行(後ろに文字のある行が続いた場合のみ返す)
+
+    for chunk in _iter_cleaned_chunks(lines):
+        for line in chunk.split('\n'):
+            if line == '':
+                continue # 連続改行(空行)は除去
+            if line.strip() == '':
+                if pending is not None:
+                    blank_lines.append(line) # 文書先頭の空白行は捨てる
+                continue
+            if pending is None:
+                line = line.lstrip() # 文書先頭の空白を除去
+            else:
+                yield pending
+                yield from blank_lines
+            pending, blank_lines = line, []
+
+    if pending is not None:
+        yield pending.rstrip() # 文書末尾の空白を除去
+
+
+def clean_markdown_text(md_content):
+    """
+    Markdown文字列を受け取り、不要な要素を除去してクリーンな文字列を返す。
+    文書全体を1回走査して記号を取り除き、空行を除いて前後の空白を削除する。
+    """
+    text = _SCAN_PATTERN.sub(_replace, md_content)
+    return '\n'.join(line for line in text.split('\n') if line).strip()
+
+
+def clean_markdown_text_regex(md_content):
+    """
+    以前の md_to_hiragana.py と同じく re.sub() を7回続けて呼ぶ実装。
+    ベンチマーク(benchmark.py)と等価性の確認(verify_md_cleanup.py)で clean_markdown_text() と比較するために残している。
+    """
+    text = md_content
+    for pattern, replacement, _ in _LEGACY_STEPS:
+        text = pattern.sub(replacement, text)
+    text = re.sub(r'\n{2,}', '\n', text)
+    return text.strip()
@@ -7,8 +7,17 @@
 import sys
 # システムモジュール。コマンドライン引数の取得、プログラムの終了、
 # 標準入出力を操作したりするために使用。
-import re # 正規表現モジュール
+import json
+import hashlib # 点字表のハッシュ値(キャッシュのバージョン)を計算するモジュール
+import argparse # コマンドライン引数を解析するモジュール
+from array import array # 1要素1バイトの配列(点字セルを詰めて保持するため)
+from collections import Counter # 点字表にない文字の出現回数を行ごとに足し合わせるため
+import numpy as np # 文書全体をまとめて点字セルに変換するための数値計算ライブラリ
+from importlib import metadata # インストール済みライブラリのバージョンを調べるモジュール
 from pykakasi import kakasi # 日本語の漢字・カタカナ・ひらがなを変換できるライブラリ。
+from md_cleanup import clean_markdown_text, iter_clean_markdown_lines # Markdownクリーンアップ(md_to_hiragana.pyと共通)
+from hiragana_fastpath import HiraganaConverter # 漢字の部分だけをkakasiで変換するひらがな変換
+from conversion_protocol import OUTPUT_FORMATS # 出力形式(--format)。変換クライアントと共通
 
 # --------------------------------------------------------
 # 点字信号定義
@@ -58,13 +67,94 @@ VOICED_MAP = { # 濁音・半濁音の対応表
 }
 
 
+# --------------------------------------------------------
+# 点字セルのパック表現
+# --------------------------------------------------------
+# 6桁の文字列 '左上,左中,左下,右上,右中,右下' は、点字の点番号 1,2,3,4,5,6 に対応する。
+# 点番号 n をビット (n-1) に割り当てた 6bit のマスクを、1セル1バイトで保持する。
+# この割り当ては Unicode の点字パターン (U+2800 + マスク) と同じなので、相互変換は足し算だけで済む。
+UNICODE_BRAILLE_BASE = 0x2800 # Unicode 点字パターンの先頭コードポイント
+
+CELL_TO_SIGNAL = [ # マスク(0〜63) → 6桁の文字列 の対応表
+    ''.join('1' if mask >> p & 1 else '0' for p in range(6)) for mask in range(64)
+]
+SIGNAL_TO_CELL = {signal: mask for mask, signal in enumerate(CELL_TO_SIGNAL)} # 6桁の文字列 → マスク
+
+
+def pack_signals(signals):
+    """
+    6桁のバイナリ信号リストを受け取り、1セル1バイト(6bitマスク)に詰めた bytes を返す。
+    """
+    return bytes(SIGNAL_TO_CELL[s] for s in signals)
+
+
+def signals_to_array(signals):
+    """
+    6桁のバイナリ信号リストを受け取り、1セル1バイトの array('B') を返す。
+    長い文書を保持したり、後からセルを書き換えたりする場合に使う。
+    """
+    return array('B', pack_signals(signals))
+
+
+def unpack_cells(cells):
+    """
+    パック表現(bytes / bytearray / array('B'))を6桁のバイナリ信号リストに戻す。
+    """
+    return [CELL_TO_SIGNAL[c] for c in cells]
+
+
+def cells_to_unicode(cells):
+    """
+    パック表現を Unicode の点字パターン文字列 (U+2800〜U+283F) に変換する。
+    """
+    return ''.join(chr(UNICODE_BRAILLE_BASE + c) for c in cells)
+
+
+def unicode_to_cells(text):
+    """
+    Unicode の点字パターン文字列をパック表現(bytes)に戻す。点字パターン以外の文字は ValueError。
+    """
+    cells = [ord(ch) - UNICODE_BRAILLE_BASE for ch in text]
+    if any(not 0 <= c < 64 for c in cells):
+        raise ValueError("6点点字のパターン(U+2800〜U+283F)以外の文字が含まれています。")
+    return bytes(cells)
+
+
+def encode_signals(signals, output_format='ascii'):
+    """
+    6桁のバイナリ信号リストを、指定された出力形式のバイト列に変換する。
+    ascii: '0'/'1'の連続文字列, packed: 1セル1バイト, unicode-braille: U+2800系の点字文字(UTF-8)
+    """
+    if output_format == 'ascii':
+        return "".join(s for s in signals if s != '\n').encode('ascii')
+    if output_format == 'packed':
+        return pack_signals(signals)
+    if output_format == 'unicode-braille':
+        return cells_to_unicode(pack_signals(signals)).encode('utf-8')
+    raise ValueError(f"未対応の出力形式です: {output_format}")
+
+
+def decode_output(data, output_format='ascii'):
+    """
+    encode_signals() の出力を6桁のバイナリ信号リストに戻す。
+    """
+    if output_format == 'ascii':
+        text = data.decode('ascii').strip()
+        return [text[i:i + 6] for i in range(0, len(text), 6)]
+    if output_format == 'packed':
+        return unpack_cells(data)
+    if output_format == 'unicode-braille':
+        return unpack_cells(unicode_to_cells(data.decode('utf-8').strip()))
+    raise ValueError(f"未対応の出力形式です: {output_format}")
+
+
 # --------------------------------------------------------
 # Markdownクリーンアップとひらがな変換の関数定義
 # --------------------------------------------------------
 
-def extract_clean_text_from_md(file_path):
+def read_markdown_file(file_path):
     """
-    Markdownファイル(.md)を引数とし、不要な要素を除去してクリーンな文字列を抽出する。
+    Markdownファイル(.md)の内容を文字列として返す。
     ファイルが存在せず読み込みに失敗した場合は None を返す。
     """
     try:
@@ -78,31 +168,74 @@ def extract_clean_text_from_md(file_path):
     except Exception:
         return None
 
-    text = md_content # 文字列が格納された変数
-    # re.sub()は、文字列の中で パターンに一致した部分を置換する役割
-    text = re.sub(r'<[^>]*>', '', text)          # HTMLタグ除去
-    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text) # リンク除去
-    text = re.sub(r'^\s*#+\s*', '', text, flags=re.MULTILINE) # 見出し除去
-    text = re.sub(r'[*_`]', '', text)            # 強調・コード除去
-    text = re.sub(r'\n{2,}', '\n', text)         # 連続改行を統一
+    return md_content
 
-    return text.strip()
-    # strip()メゾットで文字列の前後の空白や改行を削除する。
-    # 半角スペース,\t, \n, \rなど
 
+def extract_clean_text_from_md(file_path):
+    """
+    Markdownファイル(.md)を引数とし、不要な要素を除去してクリーンな文字列を抽出する。
+    ファイルが存在せず読み込みに失敗した場合は None を返す。
+    """
+    md_content = read_markdown_file(file_path)
+    if md_content is None:
+        return None
+    return clean_markdown_text(md_content)
 
-def to_hiragana(text):
+
+def iter_clean_text_from_md(file_path):
     """
-    文字列(今回はtext.strip())を受け取り、可能な文字をすべてひらがなに変換して文字列を返す。
+    Markdownファイルを1行ずつ読み込み、クリーンアップした行を順に返すジェネレータ。
+    ファイル全体を読み込まないため、長い文書でも最初の行をすぐに次の処理へ渡せる。
+    返す行を改行で連結すると、extract_clean_text_from_md() の結果と同じになる。
+    ファイルが開けない場合は OSError を送出する。
     """
-    try:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield from iter_clean_markdown_lines(f)
+
+
+_converter = None # kakasiのコンバータ(初回呼び出し時に生成し、以降は使い回す)
+_hiragana_converter = None # 漢字の部分だけをkakasiで変換するコンバータ(同上)
+
+
+def get_converter():
+    """
+    kakasiのコンバータを返す。初回のみ生成し、2回目以降は生成済みのものを使い回す。
+    変換サーバーのように同じプロセスで何度も変換する場合に、辞書の読み込みと
+    コンバータの生成を毎回やり直さないようにするため。
+    """
+    global _converter
+    if _converter is None:
         kakasi_inst = kakasi() # pykakasiライブラリのkakasiクラスのインスタンスを作成
-        kakasi_inst.setMode("J", "H").setMode("K", "H").setMode("H", "H")
+        kakasi_inst.setMode("J", "H")
+        kakasi_inst.setMode("K", "H")
+        kakasi_inst.setMode("H", "H")
         # 変換モードを設定(J: 漢字, K: カタカナ, H: ひらがな)
         # 例えばsetMode("J", "H") は、漢字をひらがなに変換する設定
         # 今回はすべてひらがなに変換する
-        conv = kakasi_inst.getConverter()# 実際に変換を行うコンバータ(変換器)を取得
-        return conv.do(text).lower().replace('\u3000', ' ').strip()
+        # setMode()は戻り値がNoneのため、メソッドチェーンにせず1つずつ呼び出す
+        _converter = kakasi_inst.getConverter()# 実際に変換を行うコンバータ(変換器)を取得
+    return _converter
+
+
+def get_hiragana_converter():
+    """
+    ひらがな変換のコンバータ(hiragana_fastpath.HiraganaConverter)を返す。初回のみ生成する。
+    convert() の結果は get_converter().do() と同じだが、ひらがな・カタカナ・英数字の部分は
+    kakasiを通さずに変換し、漢字の部分の変換結果は覚えておいて使い回す。
+    """
+    global _hiragana_converter
+    if _hiragana_converter is None:
+        _hiragana_converter = HiraganaConverter(get_converter())
+    return _hiragana_converter
+
+
+def to_hiragana(text):
+    """
+    文字列(今回はtext.strip())を受け取り、可能な文字をすべてひらがなに変換して文字列を返す。
+    """
+    try:
+        conv = get_hiragana_converter()
+        return conv.convert(text).lower().replace('\u3000', ' ').strip()
         # do()メソッドで変換を実行、lower()で英字が含まれていた場合に小文字に変換、
         # replace()で全角スペース（Unicode U+3000）を半角スペースに置換、
         # strip()で前後の空白を削除して返す
@@ -112,13 +245,31 @@ def to_hiragana(text):
         return text.lower().replace('\u3000', ' ').strip() # 漢字やカタカナはそのまま残る可能性あり
 
 
+def to_hiragana_chunk(text):
+    """
+    文書の一部(1行など)をひらがなに変換する。to_hiragana() と違い前後の空白は残す
+    (文書の途中の行の空白を消すと、点字の空白セルが減ってしまうため)。
+    """
+    return get_hiragana_converter().convert(text).lower().replace('\u3000', ' ')
+
+
+def to_hiragana_kakasi(text):
+    """
+    従来の実装(文字列全体をkakasiで変換)。to_hiragana() と同じ結果になることの確認と、
+    処理時間の比較(benchmark.py)に使う。
+    """
+    return get_converter().do(text).lower().replace('\u3000', ' ').strip()
+
+
 # --------------------------------------------------------
 # 点字バイナリ信号への変換関数 (ロジック維持)
 # --------------------------------------------------------
 
-def to_braille_signals(text):
+def to_braille_signals_loop(text):
     """
     文字列(今回はひらがな変換後のテキスト)を受け取り、6桁のバイナリ信号リストに変換する。
+    1文字ずつ処理する従来の実装。BrailleTranscoder の出力が一致することを確認するための
+    基準として残している(verify_transcoder.py)。
     """
     # 初期化
     signals = [] # 出力となる点字信号のリスト
@@ -192,6 +343,321 @@ def to_braille_signals(text):
     return signals
 
 
+# --------------------------------------------------------
+# 表引きによる一括変換 (to_braille_signals_loop と同じ結果を返す)
+# --------------------------------------------------------
+YOON_CHARS = ('ゃ', 'ゅ', 'ょ') # 拗音として直前の文字と組にする小文字
+NO_CELL = -1 # セルを出力しない位置を表す値
+INVALID_DIGIT = -2 # int()で数値にできない数字(例: '²')。数符の直後に来たら従来の実装と同じくエラーにする
+
+
+class BrailleTranscoder:
+    """
+    文字ごとの点字セル(数符・大文字符・濁点などを含む)を事前に表にしておき、
+    文書全体をNumPyの配列演算でまとめて点字セル(6bitマスク)に変換する。
+
+    数字モード・大文字モードの切り替えと拗音の組み合わせは、1文字ずつのループではなく
+    「直前の状態を変える文字がどれか」を累積最大値(maximum.accumulate)で求めることで再現している。
+    """
+
+    def __init__(self):
+        self._char_props = {} # 文字 → 点字変換に必要な性質(一度調べた文字は使い回す)
+        self._cell_signals = np.array(CELL_TO_SIGNAL) # マスク → 6桁の文字列
+
+    def _props(self, char):
+        """
+        1文字分の性質を返す。
+        (数字か, 英字・かなか, 大文字か, 拗音か, 通常セル, 数符直後のセル, 濁点類マーカー, 濁音の元のセル)
+        """
+        props = self._char_props.get(char)
+        if props is None:
+            cell = SIGNAL_TO_CELL[BRAILLE_SIGNAL_MAP.get(char.lower(), '000000')]
+            first_digit_cell = NO_CELL
+            if char.isdigit():
+                try:
+                    letter = 'j' if char == '0' else chr(ord('a') + int(char) - 1)
+                    first_digit_cell = SIGNAL_TO_CELL[BRAILLE_SIGNAL_MAP.get(letter, '000000')]
+                except ValueError:
+                    first_digit_cell = INVALID_DIGIT
+            mark = base = NO_CELL
+            if char in VOICED_MAP:
+                base_char, marker = VOICED_MAP[char]
+                mark = SIGNAL_TO_CELL[marker]
+                base = SIGNAL_TO_CELL[BRAILLE_SIGNAL_MAP.get(base_char, '000000')]
+            props = (char.isdigit(), char.isalpha(), char.isalpha() and char.isupper(),
+                     char in YOON_CHARS, cell, first_digit_cell, mark, base)
+            self._char_props[char] = props
+        return props
+
+    def _char_table(self, text):
+        """
+        文書中に出てくる文字の種類数だけ性質を調べ、(文字コードの配列, 種類ごとの性質の表, 各文字が何番目の種類か) を返す。
+        """
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        uniq, inverse = np.unique(codes, return_inverse=True)
+        table = np.array([self._props(chr(c)) for c in uniq], dtype=object)
+        return uniq, table, inverse
+
+    def encode(self, text, next_char='', is_number=False, is_caps=False):
+        """
+        文字列を点字セル(6bitマスク)の配列に変換する。
+
+        next_char は text の直後に続く文字(ストリーミング変換で次のチャンクの先頭文字を渡す)。
+        is_number / is_caps は text の直前までの数字モード・大文字モード。
+        戻り値は (セル配列(np.uint8), next_charを拗音として使ったか, 変換後の数字モード, 変換後の大文字モード)。
+        """
+        return self._encode(text, next_char, is_number, is_caps)[:4]
+
+    def unmapped_chars(self, text):
+        """
+        点字表に対応がなく '000000'(空白)として出力される文字を数え、{文字: 出現回数} を返す。
+        """
+        if not text:
+            return {}
+        unmapped = self._encode(text)[4]
+        chars, counts = np.unique(np.array(list(text))[unmapped], return_counts=True)
+        return dict(zip(chars.tolist(), counts.tolist()))
+
+    def _encode(self, text, next_char='', is_number=False, is_caps=False):
+        """
+        encode() の本体。5番目の戻り値として、点字表に対応がなく '000000' になった文字の位置(bool配列)も返す。
+        """
+        n = len(text)
+        if n == 0:
+            return np.zeros(0, dtype=np.uint8), False, is_number, is_caps, np.zeros(0, dtype=bool)
+
+        # 文字ごとの性質を、文書中に出てくる文字の種類数だけ調べて配列にする
+        uniq, table, inverse = self._char_table(text)
+        digit, alpha, upper, yoon = (table[:, k].astype(bool)[inverse] for k in range(4))
+        cell, first_digit_cell, mark, base = (table[:, k].astype(np.int16)[inverse] for k in range(4, 8))
+        voiced = mark != NO_CELL
+        next_props = self._props(next_char) if next_char else None
+
+        idx = np.arange(n)
+
+        # --- 拗音の組み合わせ ---
+        # 次の文字が拗音で、自分が濁音でなければ組になる候補。候補が連続する場合は
+        # 先頭から交互に「組の先頭」と「組の2文字目(読み飛ばし)」になる。
+        next_is_yoon = np.empty(n, dtype=bool)
+        next_is_yoon[:-1] = yoon[1:]
+        next_is_yoon[-1] = next_props is not None and next_props[3]
+        pair = next_is_yoon & ~voiced
+        run_start = np.maximum.accumulate(np.where(pair & ~np.r_[False, pair[:-1]], idx, 0))
+        pair_start = pair & ((idx - run_start) % 2 == 0)
+        processed = ~np.r_[False, pair_start[:-1]] # 組の2文字目は状態も変えずに読み飛ばされる
+
+        # --- 数字モード ---
+        # 数字で開始し、数字でも英字・かなでもない文字で終了する。英字・かなでは変化しない。
+        changes_number = processed & (digit | ~alpha)
+        last_change = np.maximum.accumulate(np.where(changes_number, idx, -1))
+        prev_change = np.r_[-1, last_change[:-1]]
+        number_before = np.where(prev_change >= 0, digit[prev_change], is_number)
+        number_marker = processed & digit & ~number_before
+
+        # --- 大文字モード ---
+        # 直前に処理された文字が大文字かどうかで決まる
+        last_processed = np.maximum.accumulate(np.where(processed, idx, -1))
+        prev_processed = np.r_[-1, last_processed[:-1]]
+        caps_before = np.where(prev_processed >= 0, upper[prev_processed], is_caps)
+        caps_marker = processed & upper & ~caps_before
+
+        # 対応表にない文字(空白セルになる)。濁音と、数符を付けて英字として出力する数字は除く
+        unmapped = processed & ~voiced & ~number_marker & (cell == 0) & (uniq[inverse] != ord(' '))
+
+        invalid = number_marker & (first_digit_cell == INVALID_DIGIT)
+        if invalid.any():
+            int(text[int(np.argmax(invalid))]) # 従来の実装と同じ ValueError を送出する
+
+        # --- 1文字あたり最大4セル [数符, 大文字符, 本体(または濁点), 拗音(または濁音の元の文字)] ---
+        main = np.where(number_marker, first_digit_cell, cell)
+        if next_props is not None:
+            next_cell = np.r_[cell[1:], next_props[4]]
+        else:
+            next_cell = np.r_[cell[1:], NO_CELL]
+        slots = np.full((n, 4), NO_CELL, dtype=np.int16)
+        slots[:, 0] = np.where(number_marker, SIGNAL_TO_CELL[NUMBER_MARKER], NO_CELL)
+        slots[:, 1] = np.where(caps_marker, SIGNAL_TO_CELL[CAPITAL_MARKER], NO_CELL)
+        slots[:, 2] = np.where(voiced, mark, main)
+        slots[:, 3] = np.where(voiced, base, np.where(pair_start, next_cell, NO_CELL))
+        slots[~processed] = NO_CELL
+
+        cells = slots.ravel()
+        cells = cells[cells != NO_CELL].astype(np.uint8)
+
+        # --- 変換後の状態 ---
+        if last_change[-1] >= 0:
+            is_number = bool(digit[last_change[-1]])
+        if last_processed[-1] >= 0:
+            is_caps = bool(upper[last_processed[-1]])
+        return cells, bool(pair_start[-1]), is_number, is_caps, unmapped
+
+    def to_cells(self, text):
+        """
+        文字列全体を点字セルのパック表現(bytes)に変換する。
+        """
+        return self.encode(text)[0].tobytes()
+
+    def to_signals(self, text):
+        """
+        文字列全体を6桁のバイナリ信号リストに変換する。to_braille_signals_loop() と同じ結果になる。
+        """
+        return self._cell_signals[self.encode(text)[0]].tolist()
+
+
+_transcoder = BrailleTranscoder()
+
+
+class BrailleStreamEncoder:
+    """
+    文字列を少しずつ受け取り、点字セル(6bitマスク)を順に返すエンコーダ。
+    数字モード・大文字モードと、チャンクの末尾で組になるか決まっていない文字(拗音の前の文字)を
+    次のチャンクに持ち越すので、チャンクに分けて変換しても文書全体を一度に変換した結果と一致する。
+    """
+
+    def __init__(self, transcoder=None):
+        self._transcoder = transcoder or _transcoder
+        self._pending = ''       # 次の文字を見るまで変換を保留している最後の1文字
+        self._is_number = False  # 数字モード
+        self._is_caps = False    # 大文字モード
+
+    def feed(self, text):
+        """
+        文字列を追加し、確定した点字セルを bytes で返す。
+        """
+        text = self._pending + text
+        if not text:
+            return b''
+        # 最後の1文字は、次の文字が拗音かどうか分かるまで保留する
+        body, self._pending = text[:-1], text[-1]
+        cells, consumed, self._is_number, self._is_caps = self._transcoder.encode(
+            body, self._pending, self._is_number, self._is_caps)
+        if consumed:
+            self._pending = '' # 保留していた文字は拗音として組にされた
+        return cells.tobytes()
+
+    def flush(self):
+        """
+        保留している文字を変換して返す。文書の終わりで呼び出す。
+        """
+        text, self._pending = self._pending, ''
+        cells, _, self._is_number, self._is_caps = self._transcoder.encode(
+            text, '', self._is_number, self._is_caps)
+        return cells.tobytes()
+
+
+def to_braille_signals(text):
+    """
+    文字列(今回はひらがな変換後のテキスト)を受け取り、6桁のバイナリ信号リストに変換する。
+    """
+    return _transcoder.to_signals(text)
+
+
+def to_braille_cells(text):
+    """
+    文字列(今回はひらがな変換後のテキスト)を受け取り、点字セルのパック表現(bytes)に変換する。
+    """
+    return _transcoder.to_cells(text)
+
+
+def markdown_to_signals(md_content):
+    """
+    Markdown文字列を受け取り、クリーンアップ → ひらがな変換 → 点字信号変換を行い、
+    6桁のバイナリ信号リストを返す。
+    """
+    extracted_text = clean_markdown_text(md_content)
+    hiragana_output = to_hiragana(extracted_text)
+    return to_braille_signals(hiragana_output)
+
+
+def markdown_to_binary_string(md_content):
+    """
+    Markdown文字列を受け取り、標準出力に出すものと同じバイナリ信号の連続文字列を返す。
+    """
+    return encode_signals(markdown_to_signals(md_content), 'ascii').decode('ascii')
+
+
+def iter_braille_cells(md_file_path, unmapped=None):
+    """
+    Markdownファイルを1行ずつ読み込み、クリーンアップ → ひらがな変換 → 点字セル変換を行いながら、
+    点字セルのパック表現(bytes)を順に返すジェネレータ。
+    長いOCR結果でも、先頭の点字セルを残りの変換を待たずにディスプレイへ送り始められる。
+    行の区切りの改行も、一括変換と同じく1セル(空白)として返す。
+    unmapped に collections.Counter を渡すと、点字表にない文字の出現回数を行ごとに加算する。
+    """
+    encoder = BrailleStreamEncoder()
+    first = True
+    for line in iter_clean_text_from_md(md_file_path):
+        text = to_hiragana_chunk(line)
+        if first:
+            text, first = text.lstrip(), False
+        else:
+            text = '\n' + text
+        if unmapped is not None:
+            unmapped.update(_transcoder.unmapped_chars(text))
+        cells = encoder.feed(text)
+        if cells:
+            yield cells
+    cells = encoder.flush()
+    if cells:
+        yield cells
+
+
+def conversion_version():
+    """
+    変換結果に影響するもの(pykakasiのバージョンと点字表)から、キャッシュ用のバージョン文字列を作る。
+    """
+    tables = json.dumps([BRAILLE_SIGNAL_MAP, VOICED_MAP, DAKUTEN_MARKER, HANDAKUTEN_MARKER,
+                         NUMBER_MARKER, CAPITAL_MARKER], sort_keys=True, ensure_ascii=False)
+    table_hash = hashlib.sha256(tables.encode('utf-8')).hexdigest()[:16]
+    try:
+        kakasi_version = metadata.version('pykakasi')
+    except metadata.PackageNotFoundError:
+        kakasi_version = 'unknown'
+    return f"pykakasi-{kakasi_version}:table-{table_hash}"
+
+
+def convert_text_cached(clean_text, cache):
+    """
+    クリーンアップ後の文字列を、キャッシュ(braille_cache.BrailleCache)を使って
+    (ひらがな, 点字セルのパック表現) に変換する。
+    文書単位でヒットしなければ、1行ずつのキャッシュを使ってひらがな変換し、結果を保存する。
+    """
+    key = cache.key(clean_text)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    hiragana_output = '\n'.join(cache.convert_line(line, to_hiragana_chunk)
+                                for line in clean_text.split('\n')).strip()
+    cells = to_braille_cells(hiragana_output)
+    cache.put(key, hiragana_output, cells)
+    return hiragana_output, cells
+
+
+def write_output(data, output_format='ascii'):
+    """
+    encode_signals() の出力を標準出力に書き出す。
+    asciiは従来どおりprint()で出力する。packedは改行もセルの値として読まれてしまうため、
+    何も付けずにそのまま書き出す。unicode-brailleはコンソールの文字コードに関係なくUTF-8で書き出す。
+    """
+    if output_format == 'ascii':
+        print(data.decode('ascii'))
+        return
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data if output_format == 'packed' else data + b'\n')
+    sys.stdout.buffer.flush()
+
+
+def print_debug_info(title, content):
+    """
+    本番の出力（PC3に渡す生の点字バイナリ列）と補助情報（ログ・可視化・デバッグ）
+    を別チャンネルに分離する設計。
+
+    標準出力は他プロセスへ渡すための純粋なデータ専用にし、デバッグは標準エラーに流す。
+    """
+    print(f"\n--- {title} ---", file=sys.stderr)
+    print(content, file=sys.stderr)
+
+
 # --------------------------------------------------------
 # メイン実行ブロック (標準出力にバイナリ文字列を出力)
 # --------------------------------------------------------
@@ -199,31 +665,115 @@ if __name__ == '__main__':
     # 上記のif文により、このファイルが直接実行された場合にのみ以下のコードを実行する。
     # 他のモジュールからインポートされた場合にメインコードが実行されるのを防ぐ。
 
-    # コマンドライン引数のチェック (エラーメッセージは標準エラー出力へ)
-    if len(sys.argv) < 2:
-        # sys.argv[0] → 実行ファイル名
-        # sys.argv[1] → ユーザーが指定した.mdファイルのパス
+    # コマンドライン引数の解析 (エラーメッセージは標準エラー出力へ)
+    parser = argparse.ArgumentParser(description="Markdownファイルを点字信号に変換する")
+    parser.add_argument('md_file_path', nargs='?', help="処理対象のMarkdownファイルパス")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='ascii',
+                        help="出力形式 (ascii: '0'/'1'の文字列, packed: 1セル1バイト, unicode-braille: U+2800系の点字文字)")
+    parser.add_argument('--stream', action='store_true',
+                        help="1行ずつ変換し、変換できた点字信号から順に出力する(キャッシュは使わない)")
+    parser.add_argument('--no-cache', action='store_true', help="変換結果のキャッシュを使わない")
+    parser.add_argument('--clear-cache', action='store_true', help="変換結果のキャッシュを削除する")
+    parser.add_argument('--cache-stats', action='store_true', help="キャッシュのヒット/ミス数を標準エラー出力に表示する")
+    parser.add_argument('--metrics', action='store_true',
+                        help="段階ごとの処理時間・メモリブロック数と点字表にない文字の数を、JSON Linesで標準エラー出力に書き出す")
+    parser.add_argument('--metrics-file', help="--metrics の出力先ファイル(追記)。指定すると --metrics も有効になる")
+    parser.add_argument('--profile', action='store_true',
+                        help="cProfile(関数ごとの処理時間)とtracemalloc(メモリ確保の多い行)のレポートを標準エラー出力に表示する")
+    args = parser.parse_args()
+
+    cache = None
+    if not args.no_cache:
+        from braille_cache import BrailleCache
+        cache = BrailleCache(conversion_version())
+        if args.clear_cache:
+            cache.clear()
+            print_debug_info("キャッシュ", f"削除しました: {cache.cache_dir}")
+            if args.md_file_path is None:
+                sys.exit(0)
+
+    if args.md_file_path is None:
         print("エラー: 処理対象のMarkdownファイルパスを引数として指定してください。", file=sys.stderr)
         sys.exit(1)
         # プログラムを終了させるための関数。
         # 引数1は異常終了を示す。
 
-    md_file_path = sys.argv[1]
-
-    # Markdownクリーンアップとテキスト抽出
-    extracted_text = extract_clean_text_from_md(md_file_path)
-    if extracted_text is None:
+    md_file_path = args.md_file_path
+
+    # 計測(--metrics / --profile)。結果はすべて標準エラー出力かファイルに出し、標準出力は変えない
+    from stage_metrics import StageMetrics, Profiler
+    collect_metrics = args.metrics or args.metrics_file is not None
+    metrics = StageMetrics(file=md_file_path, format=args.format)
+    profiler = Profiler() if args.profile else None
+    if profiler is not None:
+        profiler.start()
+
+    def report_metrics(unmapped):
+        # 計測結果を書き出す(unmapped は点字表にない文字の出現回数)
+        if profiler is not None:
+            profiler.stop()
+            print_debug_info("プロファイル", profiler.report())
+        if collect_metrics:
+            metrics.set_unmapped(unmapped)
+            metrics.write(args.metrics_file)
+
+    if args.stream:
+        # 1行ずつ変換しながら、確定した点字セルを順に標準出力へ書き出す
+        # (読み込みから出力までが行ごとに交互に進むため、計測は全体で1段階として扱う)
+        # 点字表にない文字の集計は、計測を有効にしたときだけ各行のひらがなから行う
+        num_cells = 0
+        unmapped = Counter() if collect_metrics else None
+        try:
+            with metrics.stage('stream'):
+                for cells in iter_braille_cells(md_file_path, unmapped):
+                    num_cells += len(cells)
+                    chunk = encode_signals(unpack_cells(cells), args.format)
+                    sys.stdout.buffer.write(chunk)
+                    sys.stdout.buffer.flush()
+        except OSError:
+            sys.exit(1)
+        if args.format != 'packed':
+            sys.stdout.buffer.write(b'\n')
+        sys.stdout.buffer.flush()
+        print_debug_info("バイナリ信号総数", num_cells * 6)
+        metrics.set(cells=num_cells)
+        report_metrics(unmapped)
+        sys.exit(0)
+
+    # ファイル読み込み
+    with metrics.stage('read'):
+        md_content = read_markdown_file(md_file_path)
+    if md_content is None:
         sys.exit(1)
 
-    # 可能な文字を全てひらがなへ変換
-    hiragana_output = to_hiragana(extracted_text)
-
-    # 点字信号へ変換
-    braille_signals = to_braille_signals(hiragana_output)
-
-    # 標準出力 (stdout) にバイナリ信号の連続文字列のみを出力
-    final_binary_string = "".join(s for s in braille_signals if s != '\n')
-    print(final_binary_string)
+    # Markdownクリーンアップとテキスト抽出
+    with metrics.stage('cleanup'):
+        extracted_text = clean_markdown_text(md_content)
+
+    if cache is None:
+        # kakasiの辞書の読み込み(初回のみ。変換そのものと分けて計測する)
+        with metrics.stage('kakasi_load'):
+            get_hiragana_converter()
+
+        # 可能な文字を全てひらがなへ変換
+        with metrics.stage('kakasi'):
+            hiragana_output = to_hiragana(extracted_text)
+
+        # 点字信号へ変換
+        with metrics.stage('encode'):
+            braille_signals = to_braille_signals(hiragana_output)
+    else:
+        # キャッシュにあれば変換をやり直さずに使う(ひらがな変換と点字セル変換をまとめて1段階として計測)
+        hits = cache.stats['hits']
+        with metrics.stage('kakasi+encode'):
+            hiragana_output, cells = convert_text_cached(extracted_text, cache)
+            braille_signals = unpack_cells(cells)
+        metrics.stages[-1]['cache'] = 'hit' if cache.stats['hits'] > hits else 'miss'
+
+    # 標準出力 (stdout) に点字信号のみを出力 (既定はバイナリ信号の連続文字列)
+    with metrics.stage('output'):
+        output_data = encode_signals(braille_signals, args.format)
+        write_output(output_data, args.format)
 
     # ------------------------------------------------------------------
     #  視覚化/デバッグ情報は、すべて標準エラー出力 (sys.stderr) に出す
@@ -231,16 +781,14 @@ if __name__ == '__main__':
     # sys.stderrは標準出力(stdout)とは別のチャンネルに出力されるため、
     # stdoutのバイナリデータが他のプロセスでキャプチャされるのをさまたげない
 
-    def print_debug_info(title, content):
-        """
-        本番の出力（PC3に渡す生の点字バイナリ列）と補助情報（ログ・可視化・デバッグ）
-        を別チャンネルに分離する設計。
-
-        標準出力は他プロセスへ渡すための純粋なデータ専用にし、デバッグは標準エラーに流す。
-        """
-        print(f"\n--- {title} ---", file=sys.stderr)
-        print(content, file=sys.stderr)
-
     # print_debug_info("デバッグ情報", f"入力ファイル: {md_file_path}")
     # print_debug_info("ひらがな変換結果", hiragana_output)
-    print_debug_info("バイナリ信号総数", len(final_binary_string))
\ No newline at end of file
+    print_debug_info("バイナリ信号総数", len(braille_signals) * 6)
+    if args.format != 'ascii':
+        print_debug_info(f"出力バイト数 ({args.format})", len(output_data))
+    if cache is not None:
+        if args.cache_stats:
+            print_debug_info("キャッシュ統計", cache.total_stats())
+        cache.close()
+    metrics.set(chars=len(extracted_text), cells=len(braille_signals), output_bytes=len(output_data))
+    report_metrics(_transcoder.unmapped_chars(hiragana_output) if collect_metrics else None)
\ No newline at end of file
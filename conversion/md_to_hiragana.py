@@ -1,6 +1,6 @@
 import sys
-import re
 from pykakasi import kakasi
+from md_cleanup import clean_markdown_text
 
 # 11/08地点ではこれが一番精度高い
 # .mdファイルをコマンドライン引数として受け取り、
@@ -9,7 +9,7 @@ from pykakasi import kakasi
 # --- Markdownテキストの抽出関数 (変更なし) ---
 def extract_clean_text_from_md(file_path):
     """
-    Markdownファイルの内容を読み込み、正規表現を使用してMarkdown記号やHTMLタグを除去し、
+    Markdownファイルの内容を読み込み、Markdown記号やHTMLタグを除去し、
     純粋なテキスト文字列のみを抽出する。
     """
     try:
@@ -23,26 +23,9 @@ def extract_clean_text_from_md(file_path):
         print(f"ファイル読み込み中にエラーが発生しました: {e}")
         return None
 
-    #正規表現によるクリーンアップ処理
-
-    text = md_content
-    # ... (クリーンアップ処理は省略、元のコードと同じ)
-
-    # HTMLタグの除去
-    text = re.sub(r'<[^>]*>', '', text)
-    # リンク/画像 ([text](url)) からテキスト部分のみを抽出
-    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
-    # 見出し (#) やリスト記号 (*, -, 1.) の除去
-    text = re.sub(r'^\s*#+\s*', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*[-*+]\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*\d+\.\s+', '', text, flags=re.MULTILINE)
-    # 強調、コードブロック (*, _, `) の除去
-    text = re.sub(r'[*_`]', '', text)
-    # 連続する改行を一つの改行に統一
-    text = re.sub(r'\n{2,}', '\n', text)
-
-    # 前後の空白行やスペースを削除
-    return text.strip()
+    # Markdown記号の除去(HTMLタグ・リンク/画像・見出し・リスト記号・強調/コード・連続改行)は
+    # md_to_binary.py と共通の md_cleanup.py で1回の走査で行う
+    return clean_markdown_text(md_content)
 
 
 # --- ひらがな変換関数 (【ここを修正】) ---
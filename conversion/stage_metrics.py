@@ -0,0 +1,123 @@
+# 変換処理の段階ごと(ファイル読み込み・Markdownクリーンアップ・kakasi変換・点字セル変換など)の計測。
+# 実時間・CPU時間・メモリブロック数の増減を記録し、JSON Lines(1行1レコードのJSON)で書き出す。
+# 標準出力には何も書かないので、md_to_binary.py の出力(点字信号)はそのまま他のプロセスに渡せる。
+#
+# --profile 用に、cProfile(関数ごとの処理時間)と tracemalloc(メモリを確保した行)のレポートも作る。
+
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile # 関数ごとの呼び出し回数・処理時間を計測する標準モジュール
+import tracemalloc # メモリを確保した場所(ファイル・行)を調べる標準モジュール
+from contextlib import contextmanager
+
+PROFILE_TOP_FUNCTIONS = 25 # プロファイルで表示する関数の数(累積時間の長い順)
+PROFILE_TOP_ALLOCATIONS = 10 # プロファイルで表示するメモリ確保の多い行の数
+UNMAPPED_TOP = 20 # 記録する「点字表にない文字」の種類数(多い順)
+
+
+class StageMetrics:
+    """
+    段階ごとの計測結果を集める。stage() の with ブロックの中が1つの段階になる。
+    """
+
+    def __init__(self, **context):
+        self.context = context # すべてのレコードに付ける情報(ファイル名など)
+        self.stages = []
+        self.summary = {}
+
+    @contextmanager
+    def stage(self, name, **extra):
+        """
+        with ブロックの実時間・CPU時間・メモリブロック数の増減を計測して記録する。
+        """
+        blocks = sys.getallocatedblocks()
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                'stage': name,
+                'wall_ms': round((time.perf_counter() - wall) * 1000, 3),
+                'cpu_ms': round((time.process_time() - cpu) * 1000, 3),
+                'alloc_blocks': sys.getallocatedblocks() - blocks,
+            }
+            record.update(extra)
+            self.stages.append(record)
+
+    def set(self, **values):
+        """
+        集計レコードに値を追加する(文字数・セル数など)。
+        """
+        self.summary.update(values)
+
+    def set_unmapped(self, counts):
+        """
+        点字表にない文字の出現回数 {文字: 回数} を集計レコードに追加する。
+        """
+        top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:UNMAPPED_TOP]
+        self.summary['unmapped'] = sum(counts.values())
+        self.summary['unmapped_chars'] = dict(top)
+
+    def records(self):
+        """
+        書き出すレコード(段階ごと + 集計)を返す。
+        """
+        records = [dict(self.context, event='stage', **stage) for stage in self.stages]
+        total = {
+            'wall_ms': round(sum(s['wall_ms'] for s in self.stages), 3),
+            'cpu_ms': round(sum(s['cpu_ms'] for s in self.stages), 3),
+            'alloc_blocks': sum(s['alloc_blocks'] for s in self.stages),
+        }
+        records.append(dict(self.context, event='summary', **total, **self.summary))
+        return records
+
+    def write(self, path=None):
+        """
+        JSON Linesで書き出す。path を省略すると標準エラー出力、指定するとファイルに追記する。
+        """
+        lines = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in self.records())
+        if path is None:
+            sys.stderr.write(lines)
+            sys.stderr.flush()
+        else:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+
+class Profiler:
+    """
+    cProfile と tracemalloc をまとめて開始・停止し、レポートを文字列で返す。
+    """
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._snapshot = None
+        self._peak = 0
+
+    def start(self):
+        tracemalloc.start()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self._snapshot = tracemalloc.take_snapshot()
+        self._peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def report(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        out.write(f"ピークメモリ: {self._peak / 1024:.1f} KiB\n")
+        out.write(f"メモリ確保の多い行 (上位{PROFILE_TOP_ALLOCATIONS}件):\n")
+        snapshot = self._snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+            out.write(f"  {stat}\n")
+        return out.getvalue()
@@ -0,0 +1,62 @@
+# ひらがな変換の高速化(hiragana_fastpath.HiraganaConverter)の結果が、文字列全体を kakasi の do() で
+# 変換した結果と完全に一致することを、ランダムに生成した大量の文字列で確認する。
+#
+# 使用法:
+#   python conversion/verify_hiragana.py [--cases 5000] [--seed 0]
+# 一致しない入力が見つかった場合は、その入力を標準エラー出力に表示して終了コード1で終了する。
+
+import sys
+import random
+import argparse
+import warnings
+
+from md_to_binary import get_converter, get_hiragana_converter
+from benchmark import SAMPLE_MD, _load_sample_lines
+
+# kakasi の区切り方が変わりやすい文字(長音記号・半角カナ・漢字の見出し語・カタカナの長い並び)を多めに含めた素材
+CORPUS_PIECES = (
+    list('ーー―−ｰｰかきくがしゃっカキクガシャッヴヵヶヷヺ・ヽゝ々〆') + list('ｶｷｸﾞﾟｧﾝ')
+    + list('漢字変換行動買得日本人関原点開発') + list('aB1２Ａ　 、。!?-()\n')
+    + ['データ', 'ロボット', '行動データ', '買い得', '日米', '人々', '関ヶ原', 'ｶﾞｰﾃﾞﾝ',
+       'カタカナ' * 9, 'ミドルウェア', '\U0001B150', '\U0001B164', '髙', '塚']
+)
+
+
+def random_text(rng, max_length):
+    """
+    CORPUS_PIECES から素材を選んで、ランダムな長さの文字列を作る。
+    """
+    pieces = []
+    length = rng.randint(0, max_length)
+    total = 0
+    while total < length:
+        piece = rng.choice(CORPUS_PIECES)
+        pieces.append(piece)
+        total += len(piece)
+    return ''.join(pieces)
+
+
+# --------------------------------------------------------
+# メイン実行ブロック
+# --------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="ひらがな変換の高速化と kakasi の等価性確認")
+    parser.add_argument('--cases', type=int, default=5000, help="生成する文字列の数")
+    parser.add_argument('--max-length', type=int, default=120, help="1つの文字列の最大文字数")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', DeprecationWarning) # kakasi の do() は旧APIとして警告が出る
+
+    converter = get_converter()
+    fast = get_hiragana_converter()
+    rng = random.Random(args.seed)
+    texts = [random_text(rng, args.max_length) for _ in range(args.cases)]
+    texts.append(''.join(texts)) # 全ケースを連結した文書
+    texts.append('\n'.join(_load_sample_lines())) # サンプルのOCR結果
+    for text in texts:
+        if fast.convert(text) != converter.do(text):
+            print(f"不一致: {text[:200]!r}", file=sys.stderr)
+            sys.exit(1)
+
+    print(f"一致: {args.cases}件 + 連結文書1件 + {SAMPLE_MD} "
+          f"(変換結果の使い回し: {fast.memo_info()})", file=sys.stderr)
@@ -0,0 +1,73 @@
+# Markdownクリーンアップ(md_cleanup.py)の1回走査の実装 clean_markdown_text() と、1行ずつ返す
+# iter_clean_markdown_lines() の結果が、以前の re.sub() を7回続けて呼ぶ実装(clean_markdown_text_regex)と
+# 完全に一致することを、ランダムに生成した大量のMarkdownと results/ のOCR結果で確認する。
+#
+# 使用法:
+#   python conversion/verify_md_cleanup.py [--cases 20000] [--seed 0]
+# 一致しない入力が見つかった場合は、その入力を標準エラー出力に表示して終了コード1で終了する。
+
+import os
+import sys
+import glob
+import random
+import argparse
+
+from md_cleanup import clean_markdown_text, clean_markdown_text_regex, iter_clean_markdown_lines
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'results')
+
+# 見出し・リスト記号・番号が重なる場合や、空白だけの行・複数行にまたがるタグなど、置換の境界になりやすい素材
+CORPUS_PIECES = (
+    ['# ', '## ', '#', '#x', '- ', '* ', '+ ', '1. ', '12. ', '- 1. ', '1. - ', '- - ', '-', '1.', ' - ', '* *']
+    + [' ', '  ', '\t', '　', '\n', '\n', '\n\n', '  \n', '\n  ']
+    + ['<b>', '</b>', '<br>\n', '<div\nclass="x">', '<', '>']
+    + ['[リンク](http://x)', '![画像](a.png)', '[- 項目](u)', '[**太字**](u)']
+    + ['**', '*', '_', '`', 'テキスト', 'text', '第1章', '2024年', '3.14']
+)
+
+
+def random_markdown(rng, max_pieces):
+    """
+    CORPUS_PIECES から素材を選んで、ランダムな長さのMarkdownを作る。
+    """
+    return ''.join(rng.choice(CORPUS_PIECES) for _ in range(rng.randint(0, max_pieces)))
+
+
+def check(md_content):
+    """
+    1つのMarkdownについて、文字列全体の処理・1行ずつの処理・以前の実装の結果が一致するか確認する。
+    """
+    expected = clean_markdown_text_regex(md_content)
+    streamed = '\n'.join(iter_clean_markdown_lines(md_content.splitlines(keepends=True)))
+    return clean_markdown_text(md_content) == expected and streamed == expected
+
+
+# --------------------------------------------------------
+# メイン実行ブロック
+# --------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Markdownクリーンアップの1回走査と以前の実装の等価性確認")
+    parser.add_argument('--cases', type=int, default=20000, help="生成するMarkdownの数")
+    parser.add_argument('--max-pieces', type=int, default=16, help="1つのMarkdownに使う素材の最大数")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [random_markdown(rng, args.max_pieces) for _ in range(args.cases)]
+    for md_content in documents:
+        if not check(md_content):
+            print(f"不一致: {md_content!r}", file=sys.stderr)
+            sys.exit(1)
+
+    # 大きな文書1つ分(全ケースの連結)と、OCR結果のMarkdownでも確認する
+    if not check(''.join(documents)):
+        print("不一致: 全ケースを連結した文書", file=sys.stderr)
+        sys.exit(1)
+    md_files = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.md')))
+    for md_file in md_files:
+        with open(md_file, 'r', encoding='utf-8') as f:
+            if not check(f.read()):
+                print(f"不一致: {md_file}", file=sys.stderr)
+                sys.exit(1)
+
+    print(f"一致: {args.cases}件 + 連結文書1件 + OCR結果{len(md_files)}件", file=sys.stderr)
@@ -0,0 +1,86 @@
+# BrailleTranscoder(表引きによる一括変換)と BrailleStreamEncoder(チャンクに分けた変換)の出力が、
+# 従来の1文字ずつ処理する実装(to_braille_signals_loop)と完全に一致することを、
+# ランダムに生成した大量の文字列で確認する。
+#
+# 使用法:
+#   python conversion/verify_transcoder.py [--cases 2000] [--seed 0]
+# 一致しない入力が見つかった場合は、その入力を標準エラー出力に表示して終了コード1で終了する。
+
+import sys
+import random
+import argparse
+
+from md_to_binary import (BRAILLE_SIGNAL_MAP, VOICED_MAP, BrailleStreamEncoder, pack_signals,
+                          to_braille_signals_loop, to_braille_signals)
+
+# 変換規則の境界になりやすい文字を多めに含めた文字集合
+CORPUS_CHARS = (
+    list(BRAILLE_SIGNAL_MAP) + list(VOICED_MAP) + ['ゃ', 'ゅ', 'ょ'] * 8
+    + list('0123456789') * 3 + list('ABCDEFGHIJKLMNOPQRSTUVWXYZ') * 2
+    + list('０１２３ＡＢｃ') + list('漢字変換カタカナ') + list(' \n\t.,-()[]#*_`')
+)
+
+
+def random_text(rng, max_length):
+    """
+    CORPUS_CHARS から文字を選んで、ランダムな長さの文字列を作る。
+    数字・大文字・拗音が連続する場合も出やすいよう、同じ種類の文字を続けて選ぶこともある。
+    """
+    chars = []
+    length = rng.randint(0, max_length)
+    while len(chars) < length:
+        run = rng.choice(CORPUS_CHARS) * rng.choice([1, 1, 1, 2, 3])
+        chars.extend(run)
+    return ''.join(chars)
+
+
+def stream_encode(text, rng):
+    """
+    文字列をランダムな長さのチャンクに分けて BrailleStreamEncoder で変換する。
+    """
+    encoder = BrailleStreamEncoder()
+    cells = b''
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, 8)
+        cells += encoder.feed(text[i:i + size])
+        i += size
+    return cells + encoder.flush()
+
+
+def check(text, rng):
+    """
+    1つの文字列について、一括変換・チャンクに分けた変換・従来の実装の出力が一致するか確認する。
+    """
+    expected = to_braille_signals_loop(text)
+    return (to_braille_signals(text) == expected
+            and stream_encode(text, rng) == pack_signals(expected))
+
+
+# --------------------------------------------------------
+# メイン実行ブロック
+# --------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="点字変換の一括変換と従来実装の等価性確認")
+    parser.add_argument('--cases', type=int, default=2000, help="生成する文字列の数")
+    parser.add_argument('--max-length', type=int, default=400, help="1つの文字列の最大文字数")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    total_chars = 0
+    for _ in range(args.cases):
+        text = random_text(rng, args.max_length)
+        total_chars += len(text)
+        if not check(text, rng):
+            print(f"不一致: {text!r}", file=sys.stderr)
+            sys.exit(1)
+
+    # 大きな文書1つ分(全ケースの連結)でも確認する
+    rng = random.Random(args.seed)
+    document = ''.join(random_text(rng, args.max_length) for _ in range(args.cases))
+    if not check(document, rng):
+        print("不一致: 全ケースを連結した文書", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"一致: {args.cases}件 + 連結文書1件 (合計{total_chars * 2}文字)", file=sys.stderr)